@@ -1,17 +1,39 @@
 from django.contrib import admin
+from django.utils.translation import gettext_lazy as _
 
+from .exports import streaming_order_export
 from .models import *
 
 
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    can_delete = False
+    fields = ('title', 'unit_price', 'qty', 'final_price', 'product')
+    readonly_fields = fields
 
 
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer', 'status', 'total_products', 'final_price', 'created_at')
+    list_filter = ('status', 'created_at')
+    list_select_related = ('customer__user',)
+    date_hierarchy = 'created_at'
+    inlines = (OrderLineInline,)
+    actions = ('export_csv', 'export_jsonl')
 
+    def export_csv(self, request, queryset):
+        return streaming_order_export(queryset, 'csv')
+    export_csv.short_description = _('Export selected orders as CSV')
+
+    def export_jsonl(self, request, queryset):
+        return streaming_order_export(queryset, 'jsonl')
+    export_jsonl.short_description = _('Export selected orders as JSON lines')
 
 
 admin.site.register(Category)
 admin.site.register(CartProduct)
 admin.site.register(Cart)
 admin.site.register(Customer)
-admin.site.register(Order)
+admin.site.register(Order, OrderAdmin)
 admin.site.register(Product)
-
+admin.site.register(ProductAttribute)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class eshopConfig(AppConfig):
     name = 'eshop'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
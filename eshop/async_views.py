@@ -0,0 +1,211 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseRedirect, JsonResponse
+from django.db import IntegrityError
+from django.db.models import Max, Prefetch, prefetch_related_objects
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.translation import gettext_lazy as _
+
+from .filters import CategoryProductFilter
+from .forms import OrderForm
+from .mixins import (
+    add_validator_headers,
+    category_modified_at,
+    get_request_cart,
+    get_validators,
+    product_modified_at
+)
+from .models import CartProduct, Category, Product
+from .payments import request_payment_intent, store_payment_intent
+from .utils import (
+    CART_TOTAL_SESSION_KEY,
+    KeysetPage,
+    add_cart_product,
+    change_cart_product_qty,
+    get_navigation_categories,
+    parse_cart_qty,
+    remember_cart,
+    remove_cart_product,
+    update_cart_products
+)
+
+
+def load_request(request):
+    # Resolve the lazy user and session up front, so code left on the event loop never hits the database.
+    request.user.is_authenticated
+    request.session.get(CART_TOTAL_SESSION_KEY)
+
+
+async def render_async(request, template_name, context):
+    # Context processors and {% cache %} make blocking cache calls, so templates render on the sync thread.
+    return await sync_to_async(render)(request, template_name, context)
+
+
+def load_cart(request, create=False):
+    load_request(request)
+    cart = get_request_cart(request, create=create)
+    if cart.owner is not None:
+        cart.owner.user
+    return cart
+
+
+def load_cart_products(request):
+    cart = load_cart(request)
+    if cart.pk is not None:
+        prefetch_related_objects(
+            [cart], Prefetch('products', queryset=CartProduct.objects.select_related('product'))
+        )
+    return cart
+
+
+async def base_view(request):
+
+    def get_context():
+        load_request(request)
+        return {
+            'categories': get_navigation_categories(),
+            'page': KeysetPage(Product.objects.all(), ('-id',), request.GET.get('cursor'), 24)
+        }
+
+    context = await sync_to_async(get_context)()
+    return await render_async(request, 'base.html', context)
+
+
+async def product_detail_view(request, slug):
+
+    def get_context():
+        load_request(request)
+        product = get_object_or_404(Product.objects.select_related('category'), slug=slug)
+        validators = get_validators(request, product_modified_at(product))
+        return {'product': product, 'categories': get_navigation_categories()}, validators
+
+    context, validators = await sync_to_async(get_context)()
+    response = get_conditional_response(request, **validators)
+    if response is None:
+        response = await render_async(request, 'product_detail.html', context)
+    return add_validator_headers(response, validators)
+
+
+async def category_detail_view(request, slug):
+
+    def get_validated_category():
+        load_request(request)
+        category = get_object_or_404(
+            Category.objects.annotate(products_updated_at=Max('product__updated_at')), slug=slug
+        )
+        return category, get_validators(request, category_modified_at(category))
+
+    def get_context(category):
+        url_kwargs = {key: values if len(values) > 1 else values[0] for key, values in request.GET.lists()}
+        return {
+            'category': category,
+            'product_filter': CategoryProductFilter(category, url_kwargs),
+            'categories': get_navigation_categories()
+        }
+
+    category, validators = await sync_to_async(get_validated_category)()
+    response = get_conditional_response(request, **validators)
+    if response is None:
+        context = await sync_to_async(get_context)(category)
+        response = await render_async(request, 'category_detail.html', context)
+    return add_validator_headers(response, validators)
+
+
+async def cart_view(request):
+
+    def get_context():
+        cart = load_cart_products(request)
+        remember_cart(request.session, cart)
+        return {'cart': cart, 'categories': get_navigation_categories()}
+
+    context = await sync_to_async(get_context)()
+    return await render_async(request, 'cart.html', context)
+
+
+async def change_cart(request, change, message):
+
+    def apply_change():
+        cart = load_cart(request, create=True)
+        change(cart)
+        remember_cart(request.session, cart)
+
+    await sync_to_async(apply_change)()
+    messages.add_message(request, messages.INFO, message)
+    return HttpResponseRedirect(reverse('cart'))
+
+
+async def add_to_cart_view(request, slug):
+    return await change_cart(
+        request, lambda cart: add_cart_product(cart, Product.objects.get(slug=slug)), _('Product added')
+    )
+
+
+async def delete_from_cart_view(request, slug):
+    return await change_cart(
+        request, lambda cart: remove_cart_product(cart, Product.objects.get(slug=slug)), _('Product deleted')
+    )
+
+
+async def change_qty_view(request, slug):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    qty = parse_cart_qty(request.POST.get('qty'))
+    if qty is None:
+        return HttpResponseBadRequest(_('Quantity must be at least 1'))
+    return await change_cart(
+        request, lambda cart: change_cart_product_qty(cart, Product.objects.get(slug=slug), qty), _('Quantity changed')
+    )
+
+
+async def cart_batch_view(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        payload = json.loads(request.body)
+        items = payload['items'] if isinstance(payload, dict) else payload
+        quantities = {str(item['slug']): int(item['qty']) for item in items}
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': _('Expected a list of {"slug", "qty"} items')}, status=400)
+    if any(qty < 0 for qty in quantities.values()):
+        return JsonResponse({'error': _('Quantity must not be negative')}, status=400)
+
+    def apply_batch():
+        cart = load_cart(request, create=True)
+        update_cart_products(cart, quantities)
+        remember_cart(request.session, cart)
+        return cart, list(cart.related_products.values('product__slug', 'qty', 'final_price'))
+
+    try:
+        cart, items = await sync_to_async(apply_batch)()
+    except Product.DoesNotExist as exc:
+        return JsonResponse({'error': str(exc)}, status=404)
+    except IntegrityError:
+        return JsonResponse({'error': _('Cart was changed by another request, please retry')}, status=409)
+    return JsonResponse({
+        'total_products': cart.total_products,
+        'final_price': str(cart.final_price),
+        'items': [
+            {'slug': item['product__slug'], 'qty': item['qty'], 'final_price': str(item['final_price'])}
+            for item in items
+        ]
+    })
+
+
+async def checkout_view(request):
+    cart = await sync_to_async(load_cart_products)(request)
+    # The gateway call is plain network I/O, so it runs outside the thread that owns the database connection.
+    intent = await sync_to_async(request_payment_intent, thread_sensitive=False)(cart)
+    if intent is not None:
+        await sync_to_async(store_payment_intent)(cart, intent)
+    categories = await sync_to_async(get_navigation_categories)()
+    context = {
+        'cart': cart,
+        'categories': categories,
+        'form': OrderForm(),
+        'client_secret': cart.payment_client_secret
+    }
+    return await render_async(request, 'checkout.html', context)
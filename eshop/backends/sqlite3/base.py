@@ -0,0 +1,14 @@
+from django.db.backends.sqlite3 import base
+
+from eshop.db import is_read_only
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        # A deferred BEGIN that later needs the write lock fails with "database is locked" straight away,
+        # the busy timeout only applies while acquiring it, so write transactions take it up front.
+        if is_read_only(self.settings_dict):
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute('BEGIN IMMEDIATE')
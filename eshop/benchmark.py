@@ -0,0 +1,380 @@
+import json
+import math
+import platform
+import random
+import statistics
+import time
+import uuid
+from collections import Counter, namedtuple
+from contextlib import ExitStack
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, models
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.urls.resolvers import LocalePrefixPattern
+from django.utils import timezone, translation
+
+from .models import Cart, CartProduct, Category, Customer, Order, OrderLine, Product, ProductAttribute
+from .search import index_products
+from .utils import add_cart_product, bump_catalog_version, get_customer_cart, invalidate_navigation_categories
+
+User = get_user_model()
+
+FAKE_PAYMENT_GATEWAY = 'eshop.payments.FakeGateway'
+BENCHMARK_PASSWORD = 'benchmark-password'
+BENCHMARK_LANGUAGE = 'en'
+PLACEHOLDER_IMAGE = 'benchmark/placeholder.jpg'
+PERCENTILES = (50, 90, 95, 99)
+MIN_LATENCY_DELTA_MS = 1.0
+
+ADJECTIVES = ('compact', 'rugged', 'silent', 'wireless', 'vintage', 'smart', 'premium', 'portable')
+NOUNS = ('notebook', 'headphones', 'keyboard', 'monitor', 'camera', 'speaker', 'router', 'tablet')
+COLORS = ('black', 'white', 'silver', 'red', 'blue')
+BRANDS = ('acme', 'globex', 'initech', 'umbrella', 'hooli')
+
+BenchmarkData = namedtuple('BenchmarkData', ['categories', 'products', 'customer', 'staff'])
+BenchmarkRequest = namedtuple('BenchmarkRequest', ['client', 'method', 'path', 'kwargs'])
+
+
+def next_ids(model, count):
+    start = (model.objects.aggregate(last=models.Max('pk'))['last'] or 0) + 1
+    return range(start, start + count)
+
+
+def seed_data(categories=10, products=1000, customers=50, carts=50, orders=200, seed=0):
+    rng = random.Random(seed)
+    password = make_password(BENCHMARK_PASSWORD)
+
+    category_objects = [
+        Category(pk=pk, name=f'Category {pk}', slug=f'benchmark-category-{pk}')
+        for pk in next_ids(Category, categories)
+    ]
+    Category.objects.bulk_create(category_objects)
+
+    product_objects = []
+    for pk in next_ids(Product, products):
+        title = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {pk}'
+        product_objects.append(Product(
+            pk=pk,
+            category=rng.choice(category_objects),
+            title=title.capitalize(),
+            slug=f'benchmark-product-{pk}',
+            image=PLACEHOLDER_IMAGE,
+            description=f'{title} for everyday use',
+            price=Decimal(rng.randint(100, 200000)) / 100
+        ))
+    Product.objects.bulk_create(product_objects, batch_size=500)
+    ProductAttribute.objects.bulk_create([
+        ProductAttribute(product=product, name=name, value=rng.choice(values))
+        for product in product_objects
+        for name, values in (('color', COLORS), ('brand', BRANDS))
+    ], batch_size=500)
+
+    user_objects = [
+        User(
+            pk=pk,
+            username=f'benchmark-customer-{pk}',
+            email=f'customer-{pk}@example.com',
+            first_name='Customer',
+            last_name=str(pk),
+            password=password
+        )
+        for pk in next_ids(User, customers)
+    ]
+    User.objects.bulk_create(user_objects, batch_size=500)
+    customer_objects = [
+        Customer(pk=pk, user=user, phone='+37060000000', address=f'Street {user.pk}')
+        for pk, user in zip(next_ids(Customer, customers), user_objects)
+    ]
+    Customer.objects.bulk_create(customer_objects, batch_size=500)
+
+    # Customers get at most one open cart each, the rest are anonymous session carts.
+    cart_objects = []
+    cart_lines = []
+    for index, pk in enumerate(next_ids(Cart, carts)):
+        owner = customer_objects[index] if index < len(customer_objects) else None
+        cart = Cart(pk=pk, owner=owner, for_anonymous_user=owner is None)
+        for product in rng.sample(product_objects, min(rng.randint(1, 5), len(product_objects))):
+            qty = rng.randint(1, 3)
+            cart_lines.append(CartProduct(
+                user=owner, cart=cart, product=product, qty=qty, final_price=qty * product.price
+            ))
+            cart.total_products += 1
+            cart.final_price += qty * product.price
+        cart_objects.append(cart)
+    Cart.objects.bulk_create(cart_objects, batch_size=500)
+    for pk, line in zip(next_ids(CartProduct, len(cart_lines)), cart_lines):
+        line.pk = pk
+    CartProduct.objects.bulk_create(cart_lines, batch_size=500)
+    Cart.products.through.objects.bulk_create([
+        Cart.products.through(cart_id=line.cart_id, cartproduct_id=line.pk) for line in cart_lines
+    ], batch_size=500)
+
+    order_objects = []
+    order_lines = []
+    statuses = [status for status, label in Order.STATUS_CHOICES]
+    for pk in next_ids(Order, orders):
+        customer = rng.choice(customer_objects)
+        order = Order(
+            pk=pk,
+            customer=customer,
+            first_name=customer.user.first_name,
+            last_name=customer.user.last_name,
+            phone=customer.phone,
+            address=customer.address,
+            status=rng.choice(statuses),
+            buying_type=rng.choice([Order.BUYING_TYPE_SELF, Order.BUYING_TYPE_DELIVERY])
+        )
+        for product in rng.sample(product_objects, min(rng.randint(1, 5), len(product_objects))):
+            qty = rng.randint(1, 3)
+            order_lines.append(OrderLine(
+                order=order,
+                product=product,
+                title=product.title,
+                image=product.image.name,
+                unit_price=product.price,
+                qty=qty,
+                final_price=qty * product.price
+            ))
+            order.total_products += 1
+            order.final_price += qty * product.price
+        order_objects.append(order)
+    Order.objects.bulk_create(order_objects, batch_size=500)
+    OrderLine.objects.bulk_create(order_lines, batch_size=500)
+
+    # bulk_create skips signals, so refresh what the post_save handlers would have maintained.
+    index_products(Product.objects.select_related('category').filter(pk__in=[p.pk for p in product_objects]))
+    invalidate_navigation_categories()
+    bump_catalog_version()
+
+    staff = User.objects.create_superuser(
+        f'benchmark-admin-{uuid.uuid4().hex[:8]}', 'admin@example.com', BENCHMARK_PASSWORD
+    )
+    return BenchmarkData(
+        categories=[category.slug for category in category_objects],
+        products=[product.slug for product in product_objects],
+        customer=customer_objects[0],
+        staff=staff
+    )
+
+
+class BenchmarkState:
+
+    def __init__(self, data):
+        self.data = data
+        self.anonymous = self.new_client()
+        self.customer = self.new_client(data.customer.user)
+        self.staff = self.new_client(data.staff)
+
+    def new_client(self, user=None):
+        client = Client(raise_request_exception=False)
+        if user is not None:
+            client.force_login(user)
+        return client
+
+    def product(self, iteration):
+        return self.data.products[iteration % len(self.data.products)]
+
+    def category(self, iteration):
+        return self.data.categories[iteration % len(self.data.categories)]
+
+    def fill_customer_cart(self, iteration):
+        cart = get_customer_cart(self.data.customer.user)
+        product = Product.objects.get(slug=self.product(iteration))
+        add_cart_product(cart, product)
+        return product.slug
+
+
+def scenario(client='anonymous', method='get', path=None, **kwargs):
+    def build(state, iteration):
+        return BenchmarkRequest(getattr(state, client), method, path(state, iteration), kwargs)
+    return build
+
+
+def change_qty_request(state, iteration):
+    slug = state.fill_customer_cart(iteration)
+    return BenchmarkRequest(
+        state.customer, 'post', reverse('change_qty', kwargs={'slug': slug}), {'data': {'qty': 2}}
+    )
+
+
+def delete_from_cart_request(state, iteration):
+    slug = state.fill_customer_cart(iteration)
+    return BenchmarkRequest(state.customer, 'get', reverse('delete_from_cart', kwargs={'slug': slug}), {})
+
+
+def cart_batch_request(state, iteration):
+    items = [{'slug': state.product(iteration + offset), 'qty': offset} for offset in range(3)]
+    return BenchmarkRequest(
+        state.anonymous, 'post', reverse('cart_batch'),
+        {'data': json.dumps({'items': items}), 'content_type': 'application/json'}
+    )
+
+
+def make_order_request(state, iteration):
+    state.fill_customer_cart(iteration)
+    customer = state.data.customer
+    data = {
+        'first_name': customer.user.first_name,
+        'last_name': customer.user.last_name,
+        'phone': customer.phone,
+        'address': customer.address,
+        'buying_type': Order.BUYING_TYPE_DELIVERY,
+        'comment': ''
+    }
+    return BenchmarkRequest(state.customer, 'post', reverse('make_order'), {'data': data})
+
+
+def paid_online_request(state, iteration):
+    state.fill_customer_cart(iteration)
+    return BenchmarkRequest(state.customer, 'post', reverse('paid_online'), {})
+
+
+def login_request(state, iteration):
+    data = {'username': state.data.customer.user.username, 'password': BENCHMARK_PASSWORD}
+    return BenchmarkRequest(state.new_client(), 'post', reverse('login'), {'data': data})
+
+
+def logout_request(state, iteration):
+    return BenchmarkRequest(state.new_client(state.data.customer.user), 'get', reverse('logout'), {})
+
+
+def registration_request(state, iteration):
+    username = f'benchmark-registration-{uuid.uuid4().hex[:12]}'
+    data = {
+        'username': username,
+        'password': BENCHMARK_PASSWORD,
+        'confirm_password': BENCHMARK_PASSWORD,
+        'email': f'{username}@example.com',
+        'first_name': 'New',
+        'last_name': 'Customer',
+        'phone': '+37060000000',
+        'address': 'Street 1'
+    }
+    return BenchmarkRequest(state.new_client(), 'post', reverse('registration'), {'data': data})
+
+
+SCENARIOS = {
+    'admin/': scenario('staff', path=lambda state, iteration: reverse('admin:index')),
+    'base': scenario(path=lambda state, iteration: reverse('base')),
+    'product_list_json': scenario(path=lambda state, iteration: reverse('product_list_json')),
+    'product_detail': scenario(
+        path=lambda state, iteration: reverse('product_detail', kwargs={'slug': state.product(iteration)})
+    ),
+    'category_detail': scenario(
+        path=lambda state, iteration: reverse('category_detail', kwargs={'slug': state.category(iteration)})
+    ),
+    'search': scenario(path=lambda state, iteration: reverse('search'), data={'q': NOUNS[0]}),
+    'cart': scenario(path=lambda state, iteration: reverse('cart')),
+    'cart_batch': cart_batch_request,
+    'add_to_cart': scenario(
+        'customer', path=lambda state, iteration: reverse('add_to_cart', kwargs={'slug': state.product(iteration)})
+    ),
+    'delete_from_cart': delete_from_cart_request,
+    'change_qty': change_qty_request,
+    'checkout': scenario('customer', path=lambda state, iteration: reverse('checkout')),
+    'make_order': make_order_request,
+    'login': login_request,
+    'logout': logout_request,
+    'registration': registration_request,
+    'profile': scenario('customer', path=lambda state, iteration: reverse('profile')),
+    'paid_online': paid_online_request,
+    'rosetta/': scenario(
+        'staff', path=lambda state, iteration: reverse('rosetta-file-list', kwargs={'po_filter': 'project'})
+    ),
+}
+
+
+def route_names():
+    names = []
+    for resolver in get_resolver().url_patterns:
+        if not isinstance(resolver, URLResolver) or not isinstance(resolver.pattern, LocalePrefixPattern):
+            continue
+        for pattern in resolver.url_patterns:
+            if isinstance(pattern, URLPattern):
+                names.append(pattern.name)
+            else:
+                names.append(str(pattern.pattern))
+    return names
+
+
+def uncovered_routes():
+    return [name for name in route_names() if name not in SCENARIOS]
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def summarize(timings, queries, statuses):
+    summary = {f'p{percent}_ms': round(percentile(timings, percent), 3) for percent in PERCENTILES}
+    summary.update({
+        'samples': len(timings),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries_median': statistics.median(queries),
+        'queries_max': max(queries),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())}
+    })
+    return summary
+
+
+def measure(request):
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+        start = time.perf_counter()
+        response = getattr(request.client, request.method)(request.path, **request.kwargs)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+    return elapsed * 1000, sum(len(context.captured_queries) for context in contexts), response.status_code
+
+
+def run_benchmark(data, routes=None, iterations=20, warmup=2):
+    results = {}
+    with translation.override(BENCHMARK_LANGUAGE):
+        state = BenchmarkState(data)
+        for name in routes or route_names():
+            timings, queries, statuses = [], [], Counter()
+            for iteration in range(warmup + iterations):
+                elapsed, query_count, status = measure(SCENARIOS[name](state, iteration))
+                if iteration < warmup:
+                    continue
+                timings.append(elapsed)
+                queries.append(query_count)
+                statuses[status] += 1
+            results[name] = summarize(timings, queries, statuses)
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'async_views': settings.ASYNC_VIEWS,
+            'iterations': iterations,
+            'warmup': warmup
+        },
+        'routes': results
+    }
+
+
+def compare_results(baseline, current, threshold=0.2):
+    regressions = []
+    for name, result in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if result[metric] - before[metric] > max(before[metric] * threshold, MIN_LATENCY_DELTA_MS):
+                regressions.append((name, metric, before[metric], result[metric]))
+        if result['queries_max'] > before['queries_max']:
+            regressions.append((name, 'queries_max', before['queries_max'], result['queries_max']))
+    return regressions
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def default_cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if default_cache_is_shared():
+        return []
+    return [Warning(
+        'The default cache is local to each process.',
+        hint=(
+            'Catalog invalidation, conditional GET and the login throttle need one cache shared by every '
+            'worker and by management commands. Set CACHE_BACKEND=memcached and CACHE_LOCATION.'
+        ),
+        id='eshop.W001',
+    )]
@@ -0,0 +1,15 @@
+from django.utils.functional import SimpleLazyObject
+
+from .utils import CART_TOTAL_SESSION_KEY, get_catalog_version, get_navigation_categories
+
+
+def cart_badge(request):
+    session = getattr(request, 'session', {})
+    return {'cart_total_products': session.get(CART_TOTAL_SESSION_KEY, 0)}
+
+
+def catalog(request):
+    return {
+        'catalog_version': get_catalog_version(),
+        'categories': SimpleLazyObject(get_navigation_categories)
+    }
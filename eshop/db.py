@@ -0,0 +1,22 @@
+from django.conf import settings
+
+
+def is_read_only(settings_dict):
+    return 'mode=ro' in str(settings_dict['NAME'])
+
+
+def sqlite_pragma_statements(read_only=False):
+    # journal_mode is stored in the database file, only the writer can (and needs to) switch it.
+    return [
+        f'PRAGMA {name} = {value}'
+        for name, value in settings.SQLITE_PRAGMAS.items()
+        if not (read_only and name == 'journal_mode')
+    ]
+
+
+def configure_sqlite_connection(connection):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for statement in sqlite_pragma_statements(is_read_only(connection.settings_dict)):
+            cursor.execute(statement)
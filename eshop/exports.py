@@ -0,0 +1,91 @@
+import csv
+import json
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Order, OrderLine
+
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+ORDER_FIELDS = [
+    'id', 'created_at', 'order_date', 'status', 'buying_type', 'customer_id', 'first_name', 'last_name',
+    'phone', 'address', 'comment', 'total_products', 'final_price'
+]
+LINE_FIELDS = ['product_id', 'title', 'unit_price', 'qty', 'final_price']
+CSV_HEADER = [f'order_{field}' for field in ORDER_FIELDS] + [f'line_{field}' for field in LINE_FIELDS]
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def filter_orders(queryset=None, date_from=None, date_to=None, statuses=None):
+    queryset = Order.objects.all() if queryset is None else queryset
+    if date_from:
+        queryset = queryset.filter(created_at__date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(created_at__date__lte=date_to)
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    return queryset
+
+
+def iter_order_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    # Short pk-keyset reads instead of one long-lived cursor, so SQLite never keeps a read transaction open.
+    orders = queryset.order_by('pk').values(*ORDER_FIELDS)
+    last_pk = 0
+    while True:
+        chunk = list(orders.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1]['id']
+        lines = OrderLine.objects.filter(
+            order_id__in=[order['id'] for order in chunk]
+        ).order_by('order_id', 'pk').values('order_id', *LINE_FIELDS)
+        grouped = {
+            order_id: list(order_lines)
+            for order_id, order_lines in groupby(lines, key=lambda line: line['order_id'])
+        }
+        for order in chunk:
+            order['lines'] = [
+                {field: line[field] for field in LINE_FIELDS} for line in grouped.get(order['id'], [])
+            ]
+        yield chunk
+
+
+def export_orders_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for chunk in iter_order_chunks(queryset, chunk_size):
+        rows = []
+        for order in chunk:
+            order_values = [order[field] for field in ORDER_FIELDS]
+            for line in order['lines'] or [dict.fromkeys(LINE_FIELDS, '')]:
+                rows.append(writer.writerow(order_values + [line[field] for field in LINE_FIELDS]))
+        yield ''.join(rows)
+
+
+def export_orders_jsonl(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    for chunk in iter_order_chunks(queryset, chunk_size):
+        yield ''.join(json.dumps(order, cls=DjangoJSONEncoder) + '\n' for order in chunk)
+
+
+EXPORTERS = {'csv': export_orders_csv, 'jsonl': export_orders_jsonl}
+
+
+def export_orders(queryset, file_format='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    return EXPORTERS[file_format](queryset, chunk_size)
+
+
+def streaming_order_export(queryset, file_format='csv', filename='orders'):
+    response = StreamingHttpResponse(
+        export_orders(queryset, file_format), content_type=EXPORT_CONTENT_TYPES[file_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
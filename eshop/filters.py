@@ -0,0 +1,188 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db import models
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
+from django.utils.translation import gettext_lazy as _
+
+from .models import ProductAttribute
+from .utils import KeysetPage, get_catalog_version
+
+
+PRICE_RANGES = (
+    (None, Decimal(50)),
+    (Decimal(50), Decimal(100)),
+    (Decimal(100), Decimal(500)),
+    (Decimal(500), Decimal(1000)),
+    (Decimal(1000), None),
+)
+
+SORT_ORDERINGS = {
+    'newest': (_('Newest'), ('-id',)),
+    'price': (_('Price: low to high'), ('price', 'id')),
+    '-price': (_('Price: high to low'), ('-price', '-id')),
+    'title': (_('Title'), ('title', 'id')),
+}
+
+RESERVED_PARAMS = {'price_min', 'price_max', 'sort', 'cursor'}
+
+ATTRIBUTE_NAMES_CACHE_KEY = 'eshop:attribute_names:{category}:{version}'
+ATTRIBUTE_NAMES_CACHE_TIMEOUT = 60 * 60
+
+
+def parse_price(value):
+    try:
+        price = Decimal(value) if value not in (None, '') else None
+    except (InvalidOperation, TypeError):
+        return None
+    return price if price is not None and price.is_finite() else None
+
+
+class CategoryProductFilter:
+
+    page_size = 24
+
+    def __init__(self, category, params):
+        self.category = category
+        self.params = {key: value if isinstance(value, list) else [value] for key, value in params.items()}
+        self.price_min = parse_price(self.get_param('price_min'))
+        self.price_max = parse_price(self.get_param('price_max'))
+        self.sort = self.get_param('sort') if self.get_param('sort') in SORT_ORDERINGS else 'newest'
+
+    @cached_property
+    def attribute_names(self):
+        key = ATTRIBUTE_NAMES_CACHE_KEY.format(category=self.category.pk, version=get_catalog_version())
+        names = cache.get(key)
+        if names is None:
+            names = sorted(
+                ProductAttribute.objects.filter(product__category=self.category)
+                .values_list('name', flat=True).distinct()
+            )
+            cache.set(key, names, ATTRIBUTE_NAMES_CACHE_TIMEOUT)
+        return names
+
+    @cached_property
+    def attributes(self):
+        return {
+            name: self.params[name] for name in self.attribute_names if name in self.params and name not in RESERVED_PARAMS
+        }
+
+    @cached_property
+    def page(self):
+        return KeysetPage(self.get_queryset(), SORT_ORDERINGS[self.sort][1], self.get_param('cursor'), self.page_size)
+
+    @cached_property
+    def next_page_url(self):
+        return self.build_url(cursor=[self.page.next_cursor]) if self.page.next_cursor else None
+
+    @cached_property
+    def facets(self):
+        return self.get_facets()
+
+    @cached_property
+    def cache_key(self):
+        # Built from the recognised filters only, so unknown query params cannot multiply the cached fragments.
+        return urlencode(sorted({**self.get_base_params(), 'cursor': [self.page.cache_key]}.items()), doseq=True)
+
+    def get_param(self, name):
+        values = self.params.get(name)
+        return values[-1] if values else None
+
+    def get_queryset(self, skip_price=False, skip_attribute=None):
+        queryset = self.category.product_set.all()
+        if not skip_price:
+            if self.price_min is not None:
+                queryset = queryset.filter(price__gte=self.price_min)
+            if self.price_max is not None:
+                queryset = queryset.filter(price__lt=self.price_max)
+        for name, values in self.attributes.items():
+            if name != skip_attribute:
+                queryset = queryset.filter(
+                    pk__in=ProductAttribute.objects.filter(name=name, value__in=values).values('product_id')
+                )
+        return queryset
+
+    def get_page(self):
+        return self.page.result
+
+    def get_base_params(self):
+        params = {name: sorted(set(values)) for name, values in self.attributes.items()}
+        for name, price in (('price_min', self.price_min), ('price_max', self.price_max)):
+            if price is not None:
+                params[name] = [format(price.normalize(), 'f')]
+        if self.sort != 'newest':
+            params['sort'] = [self.sort]
+        return params
+
+    def build_url(self, **changes):
+        params = self.get_base_params()
+        for key, values in changes.items():
+            if values is None:
+                params.pop(key, None)
+            else:
+                params[key] = values
+        return '?' + urlencode(params, doseq=True) if params else '?'
+
+    def get_price_facet(self):
+        buckets = models.Case(
+            *[
+                models.When(
+                    models.Q(**{
+                        key: bound for key, bound in (('price__gte', low), ('price__lt', high)) if bound is not None
+                    }),
+                    then=models.Value(index)
+                )
+                for index, (low, high) in enumerate(PRICE_RANGES)
+            ],
+            output_field=models.IntegerField()
+        )
+        counts = dict(
+            self.get_queryset(skip_price=True).order_by().annotate(bucket=buckets)
+            .values_list('bucket').annotate(count=models.Count('id'))
+        )
+        facet = []
+        for index, (low, high) in enumerate(PRICE_RANGES):
+            selected = self.price_min == low and self.price_max == high
+            facet.append({
+                'low': low,
+                'high': high,
+                'count': counts.get(index, 0),
+                'selected': selected,
+                'url': self.build_url(
+                    price_min=None if selected or low is None else [low],
+                    price_max=None if selected or high is None else [high]
+                )
+            })
+        return facet
+
+    def get_attribute_facet(self, name):
+        counts = (
+            ProductAttribute.objects
+            .filter(name=name, product__in=self.get_queryset(skip_attribute=name))
+            .values_list('value')
+            .annotate(count=models.Count('product', distinct=True))
+            .order_by('value')
+        )
+        selected_values = self.attributes.get(name, [])
+        facet = []
+        for value, count in counts:
+            selected = value in selected_values
+            values = [item for item in selected_values if item != value] if selected else selected_values + [value]
+            facet.append({
+                'value': value,
+                'count': count,
+                'selected': selected,
+                'url': self.build_url(**{name: values or None})
+            })
+        return facet
+
+    def get_facets(self):
+        return {
+            'price': self.get_price_facet(),
+            'attributes': [(name, self.get_attribute_facet(name)) for name in self.attribute_names],
+            'sort': [
+                {'value': key, 'label': label, 'selected': key == self.sort, 'url': self.build_url(sort=[key])}
+                for key, (label, ordering) in SORT_ORDERINGS.items()
+            ]
+        }
@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.models import User
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from .models import Order
+from .utils import login_attempts_exceeded, record_failed_login, reset_login_attempts
 
 
 class OrderForm(forms.ModelForm):
@@ -18,22 +20,35 @@ class LoginForm(forms.ModelForm):
 
     password = forms.CharField(widget=forms.PasswordInput)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, request=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.request = request
+        self.user = None
+        self.throttled = False
         self.fields['username'].label = _('User name')
         self.fields['password'].label = _('Password')
 
     def clean(self):
-        username = self.cleaned_data['username']
-        password = self.cleaned_data['password']
-        if not User.objects.filter(username=username).exists():
+        username = self.cleaned_data.get('username')
+        password = self.cleaned_data.get('password')
+        if self.request is not None and login_attempts_exceeded(self.request, username):
+            self.throttled = True
+            raise forms.ValidationError(_('Too many login attempts, please try again later'))
+        self.user = User.objects.filter(username=username).first()
+        if self.user is None or not self.user.is_active:
+            self.record_failure(username)
             raise forms.ValidationError(_('User not found'))
-        user = User.objects.filter(username=username).first()
-        if user:
-            if not user.check_password(password):
-                raise forms.ValidationError(_('Wrong password'))
+        if not self.user.check_password(password):
+            self.record_failure(username)
+            raise forms.ValidationError(_('Wrong password'))
+        if self.request is not None:
+            reset_login_attempts(self.request, username)
         return self.cleaned_data
 
+    def record_failure(self, username):
+        if self.request is not None:
+            record_failed_login(self.request, username)
+
     class Meta:
         model = User
         fields = ['username', 'password']
@@ -60,21 +75,17 @@ class RegistrationForm(forms.ModelForm):
         self.fields['address'].label = _('Address')
         self.fields['email'].label = _('Email')
 
-    def clean_email(self):
-        email = self.cleaned_data['email']
-        if User.objects.filter(email=email).exists():
-            raise forms.ValidationError(_('Email already exists'))
-        return email
-
-    def clean_username(self):
-        username = self.cleaned_data['username']
-        if User.objects.filter(username=username).exists():
-            raise forms.ValidationError(_("User already exists"))
-        return username
-
     def clean(self):
-        password = self.cleaned_data['password']
-        confirm_password = self.cleaned_data['confirm_password']
+        username = self.cleaned_data.get('username')
+        email = self.cleaned_data.get('email')
+        taken = User.objects.filter(Q(username=username) | Q(email=email)).values_list('username', 'email')
+        for taken_username, taken_email in taken:
+            if taken_username == username and 'username' not in self.errors:
+                self.add_error('username', _("User already exists"))
+            if taken_email == email and 'email' not in self.errors:
+                self.add_error('email', _('Email already exists'))
+        password = self.cleaned_data.get('password')
+        confirm_password = self.cleaned_data.get('confirm_password')
         if password != confirm_password:
             raise forms.ValidationError(_("Passwords don't match"))
         return self.cleaned_data
@@ -0,0 +1,108 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import Product
+from .utils import bump_catalog_version
+
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants')
+    return _executor
+
+
+def variant_name(name, width, extension=None):
+    root, original_extension = os.path.splitext(name)
+    return f'{root}_w{width}{extension or original_extension}'
+
+
+def variants_outdated(product):
+    return bool(product.image) and product.image_variants.get('source') != product.image.name
+
+
+def save_variant(storage, name, image, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.save(buffer, image_format, quality=85)
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_image_variants(product_id):
+    product = Product.objects.filter(pk=product_id).only('image', 'image_variants').first()
+    if product is None or not variants_outdated(product):
+        return
+    name = product.image.name
+    storage = product.image.storage
+    original_format = VARIANT_FORMATS.get(os.path.splitext(name)[1].lower())
+    with storage.open(name) as image_file:
+        image = Image.open(image_file)
+        image.load()
+    widths = []
+    for width in settings.IMAGE_VARIANT_WIDTHS:
+        if width >= image.width:
+            continue
+        resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        save_variant(storage, variant_name(name, width, '.webp'), resized, 'WEBP')
+        if original_format and original_format != 'WEBP':
+            save_variant(storage, variant_name(name, width), resized, original_format)
+        widths.append(width)
+    # update() skips the save signals, so refresh updated_at and the catalog version here to drop cached markup.
+    updated = Product.objects.filter(pk=product_id, image=name).update(
+        image_variants={'source': name, 'widths': widths}, updated_at=timezone.now()
+    )
+    if updated:
+        bump_catalog_version()
+
+
+def run_image_variants(product_id):
+    try:
+        generate_image_variants(product_id)
+    except Exception:
+        logger.exception('Could not generate image variants for product %s', product_id)
+
+
+def run_image_variants_in_worker(product_id):
+    try:
+        run_image_variants(product_id)
+    finally:
+        connection.close()
+
+
+def schedule_image_variants(product):
+    if not variants_outdated(product):
+        return
+    if settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: get_executor().submit(run_image_variants_in_worker, product.pk))
+    else:
+        transaction.on_commit(lambda: run_image_variants(product.pk))
+
+
+def image_srcset(product, extension=None):
+    if not product.image or product.image_variants.get('source') != product.image.name:
+        return ''
+    storage = product.image.storage
+    if extension is None and os.path.splitext(product.image.name)[1].lower() == '.webp':
+        extension = '.webp'
+    return ', '.join(
+        f'{storage.url(variant_name(product.image.name, width, extension))} {width}w'
+        for width in product.image_variants.get('widths', [])
+    )
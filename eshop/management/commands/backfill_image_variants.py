@@ -0,0 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from eshop.images import run_image_variants_in_worker, variants_outdated
+from eshop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Generate missing or outdated image variants for existing products in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_VARIANT_WORKERS)
+
+    def handle(self, *args, **options):
+        products = Product.objects.only('image', 'image_variants').order_by('pk').iterator(chunk_size=1000)
+        product_ids = [product.pk for product in products if variants_outdated(product)]
+        self.stdout.write(f'Generating image variants for {len(product_ids)} products')
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for done, _ in enumerate(executor.map(run_image_variants_in_worker, product_ids), start=1):
+                if done % 100 == 0:
+                    self.stdout.write(f'Processed {done} products')
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(product_ids)} products'))
@@ -0,0 +1,112 @@
+import json
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from eshop.benchmark import (
+    FAKE_PAYMENT_GATEWAY,
+    compare_results,
+    route_names,
+    run_benchmark,
+    seed_data,
+    uncovered_routes
+)
+
+
+class DisableMigrations(dict):
+
+    def __contains__(self, item):
+        return True
+
+    def __getitem__(self, item):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database with synthetic data and measure latency and query counts for every route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--carts', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+        parser.add_argument('--iterations', type=int, default=20, help='Measured requests per route')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per route')
+        parser.add_argument('--route', action='append', dest='routes', help='Only benchmark the given route names')
+        parser.add_argument('--db-file', help='Run against an SQLite file instead of the in-memory test database')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Compare against a previous JSON result and report regressions')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative latency growth')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        missing = uncovered_routes()
+        if missing:
+            raise CommandError(f"No benchmark scenario for routes: {', '.join(missing)}")
+        routes = options['routes'] or route_names()
+        unknown = sorted(set(routes) - set(route_names()))
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(unknown)}")
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        if options['db_file']:
+            connection.settings_dict['TEST']['NAME'] = options['db_file']
+        setup_test_environment()
+        # The schema is built straight from the models, like the test suite, since migrations are not committed.
+        with override_settings(MIGRATION_MODULES=DisableMigrations()):
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        for alias in connections:
+            if connections[alias].settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+                connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            with override_settings(PAYMENT_GATEWAY=FAKE_PAYMENT_GATEWAY, IMAGE_VARIANTS_ASYNC=False):
+                cache.clear()
+                self.stdout.write('Seeding synthetic data')
+                data = seed_data(
+                    categories=options['categories'],
+                    products=options['products'],
+                    customers=options['customers'],
+                    carts=options['carts'],
+                    orders=options['orders'],
+                    seed=options['seed']
+                )
+                results = run_benchmark(data, routes, options['iterations'], options['warmup'])
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        results['meta']['volumes'] = {
+            name: options[name] for name in ('categories', 'products', 'customers', 'carts', 'orders')
+        }
+        results['meta']['seed'] = options['seed']
+
+        self.stdout.write(f"{'route':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}  statuses")
+        for name, result in results['routes'].items():
+            statuses = ' '.join(f'{status}x{count}' for status, count in result['statuses'].items())
+            self.stdout.write(
+                f"{name:<20}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{result['queries_max']:>10}  {statuses}"
+            )
+            if any(status.startswith('5') for status in result['statuses']):
+                self.stderr.write(f'{name} answered with a server error')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = compare_results(baseline, results, options['threshold'])
+            for name, metric, before, after in regressions:
+                self.stderr.write(f'Regression in {name}: {metric} {before} -> {after}')
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+            elif options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
@@ -0,0 +1,32 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Delete expired rows from the database session table in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Also delete unexpired rows, once sessions no longer live in the database'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        sessions = Session.objects.all()
+        if not options['all']:
+            sessions = sessions.filter(expire_date__lt=timezone.now())
+        deleted = 0
+        while True:
+            # Short transactions keep the SQLite write lock free for the shop between batches.
+            with transaction.atomic():
+                keys = list(sessions.values_list('session_key', flat=True)[:options['batch_size']])
+                if not keys:
+                    break
+                deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            self.stdout.write(f'Deleted {deleted} sessions')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} sessions from the database table'))
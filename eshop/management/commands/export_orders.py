@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eshop.exports import EXPORT_CHUNK_SIZE, EXPORTERS, export_orders, filter_orders
+from eshop.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Stream orders and their lines as CSV or JSON lines, in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORTERS), default='csv')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First order date, YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last order date, YYYY-MM-DD')
+        parser.add_argument(
+            '--status', action='append', dest='statuses',
+            choices=[status for status, label in Order.STATUS_CHOICES], help='Can be repeated'
+        )
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if options['date_from'] and options['date_to'] and options['date_from'] > options['date_to']:
+            raise CommandError('--from must not be after --to')
+        orders = filter_orders(date_from=options['date_from'], date_to=options['date_to'], statuses=options['statuses'])
+        chunks = export_orders(orders, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stderr.write(f"Orders written to {options['output']}")
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
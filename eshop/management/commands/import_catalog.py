@@ -0,0 +1,215 @@
+import csv
+import json
+import os
+import sys
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries, transaction
+from django.utils import timezone
+
+from eshop.checks import default_cache_is_shared
+from eshop.models import Category, Product
+from eshop.search import index_products
+from eshop.utils import bump_catalog_version, invalidate_navigation_categories
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+PRODUCT_FIELDS = ['category_id', 'title', 'description', 'price', 'image']
+PRICE_QUANTUM = Decimal('0.01')
+# Row values checked against the model field validators, so bad rows are skipped instead of failing the batch.
+VALIDATED_FIELDS = (
+    ('slug', Product, 'slug'),
+    ('title', Product, 'title'),
+    ('price', Product, 'price'),
+    ('category', Category, 'slug'),
+    ('category_name', Category, 'name'),
+)
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        yield row
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSONL catalog file and upsert categories and products in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Catalog file, or '-' to read from stdin")
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--no-index', action='store_true', help='Skip updating the search index')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError('Cannot tell the file format, pass --format csv or --format jsonl')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.index = not options['no_index']
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        self.totals = {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        self.images_changed = False
+
+        if options['path'] == '-':
+            self.import_stream(READERS[file_format](sys.stdin), options['batch_size'])
+        else:
+            with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+                self.import_stream(READERS[file_format](stream), options['batch_size'])
+
+        invalidate_navigation_categories()
+        bump_catalog_version()
+        if not default_cache_is_shared():
+            self.stderr.write(
+                'The default cache is local to this process, running web workers keep serving cached catalog '
+                'pages until their entries expire. Set CACHE_BACKEND=memcached to share invalidation.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Import finished: {created} created, {updated} updated, {unchanged} unchanged, {skipped} skipped'.format(
+                **self.totals
+            )
+        ))
+        if self.images_changed:
+            self.stdout.write('Product images changed, run backfill_image_variants to regenerate their variants')
+
+    def import_stream(self, rows, batch_size):
+        rows = enumerate(rows, start=1)
+        processed = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                self.import_batch(batch)
+            processed += len(batch)
+            # Keeps memory flat when DEBUG collects executed queries.
+            reset_queries()
+            memory = peak_memory_mb()
+            self.stdout.write(
+                f'Processed {processed} rows' + (f', peak memory {memory:.1f} MB' if memory is not None else '')
+            )
+
+    def parse_row(self, line, row):
+        if not isinstance(row, dict):
+            self.stderr.write(f'Row {line}: skipped, not a JSON object')
+            return None
+        item = {field: str(row.get(field) or '').strip() for field in ('slug', 'title', 'category', 'image')}
+        if not item['slug'] or not item['title'] or not item['category']:
+            self.stderr.write(f'Row {line}: skipped, slug, title and category are required')
+            return None
+        try:
+            item['price'] = Decimal(str(row.get('price'))).quantize(PRICE_QUANTUM)
+        except InvalidOperation:
+            item['price'] = None
+        if item['price'] is None or not item['price'].is_finite():
+            self.stderr.write(f"Row {line}: skipped, invalid price {row.get('price')!r}")
+            return None
+        item['category_name'] = str(row.get('category_name') or item['category']).strip()
+        item['description'] = row.get('description') or None
+        errors = []
+        for key, model, field in VALIDATED_FIELDS:
+            try:
+                model._meta.get_field(field).run_validators(item[key])
+            except ValidationError as exc:
+                errors.append(f"invalid {key} {item[key]!r} ({' '.join(exc.messages)})")
+        if item['price'] < 0:
+            errors.append(f"invalid price {item['price']!r} (must not be negative)")
+        if errors:
+            self.stderr.write(f"Row {line}: skipped, {', '.join(errors)}")
+            return None
+        return item
+
+    def resolve_categories(self, items):
+        missing = {}
+        for item in items:
+            if item['category'] not in self.categories:
+                missing.setdefault(item['category'], item['category_name'])
+        if missing:
+            Category.objects.bulk_create(
+                [Category(slug=slug, name=name) for slug, name in missing.items()], ignore_conflicts=True
+            )
+            self.categories.update(Category.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+
+    def import_batch(self, batch):
+        items = {}
+        for line, row in batch:
+            item = self.parse_row(line, row)
+            if item is None:
+                self.totals['skipped'] += 1
+            else:
+                items[item['slug']] = item
+        if not items:
+            return
+        self.resolve_categories(items.values())
+
+        existing = {
+            product.slug: product
+            for product in Product.objects.filter(slug__in=items).only('slug', *PRODUCT_FIELDS)
+        }
+        new_products = []
+        changed_products = []
+        now = timezone.now()
+        for slug, item in items.items():
+            values = {
+                'category_id': self.categories[item['category']],
+                'title': item['title'],
+                'description': item['description'],
+                'price': item['price'],
+                'image': item['image']
+            }
+            product = existing.get(slug)
+            if product is None:
+                new_products.append(Product(slug=slug, **values))
+                continue
+            current = {field: getattr(product, field) for field in PRODUCT_FIELDS}
+            current['image'] = product.image.name
+            if current == values:
+                self.totals['unchanged'] += 1
+                continue
+            if current['image'] != values['image']:
+                self.images_changed = True
+            for field, value in values.items():
+                setattr(product, field, value)
+            # bulk_update skips auto_now, and conditional GET relies on updated_at.
+            product.updated_at = now
+            changed_products.append(product)
+        if new_products:
+            Product.objects.bulk_create(new_products)
+            self.images_changed = self.images_changed or any(product.image for product in new_products)
+        if changed_products:
+            Product.objects.bulk_update(changed_products, PRODUCT_FIELDS + ['updated_at'])
+        self.totals['created'] += len(new_products)
+        self.totals['updated'] += len(changed_products)
+
+        if self.index and (new_products or changed_products):
+            touched = [product.slug for product in new_products + changed_products]
+            index_products(Product.objects.select_related('category').filter(slug__in=touched))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from eshop.models import Product
+from eshop.search import clear_search_index, create_search_index, index_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        create_search_index()
+        clear_search_index()
+        products = Product.objects.select_related('category').order_by('pk')
+        last_pk = 0
+        indexed = 0
+        while True:
+            batch = list(products.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                index_products(batch)
+            indexed += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'Indexed {indexed} products')
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt with {indexed} products'))
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from eshop.models import Cart, CartProduct
+
+
+REPAIR_CHUNK_SIZE = 500
+
+
+def drifted_carts(carts):
+    # Detection and repair both total the lines through CartProduct.cart, so they can never disagree.
+    return carts.annotate(
+        lines_price=models.functions.Coalesce(models.Sum('related_products__final_price'), 0,
+                                              output_field=models.DecimalField()),
+        lines_count=models.Count('related_products')
+    ).exclude(final_price=models.F('lines_price'), total_products=models.F('lines_count'))
+
+
+class Command(BaseCommand):
+    help = 'Verify stored cart totals against cart lines and repair the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report carts with wrong totals')
+        parser.add_argument('--include-ordered', action='store_true', help='Check carts that are already in an order')
+
+    def merge_duplicate_lines(self, dry_run):
+        duplicates = CartProduct.objects.values('cart', 'product').annotate(
+            lines=models.Count('id'), first_id=models.Min('id')
+        ).filter(lines__gt=1)
+        merged = 0
+        for duplicate in list(duplicates):
+            self.stdout.write(f"Cart {duplicate['cart']}: {duplicate['lines']} lines for product {duplicate['product']}")
+            if dry_run:
+                continue
+            with transaction.atomic():
+                lines = list(CartProduct.objects.select_for_update().select_related('product').filter(
+                    cart=duplicate['cart'], product=duplicate['product']
+                ))
+                kept = next(line for line in lines if line.pk == duplicate['first_id'])
+                extra_ids = [line.pk for line in lines if line is not kept]
+                kept.qty = sum(line.qty for line in lines)
+                kept.save()
+                Cart.products.through.objects.filter(cartproduct_id__in=extra_ids).delete()
+                CartProduct.objects.filter(pk__in=extra_ids).delete()
+            merged += 1
+        return merged
+
+    def handle(self, *args, **options):
+        merged = self.merge_duplicate_lines(options['dry_run'])
+        if merged:
+            self.stdout.write(self.style.SUCCESS(f'Merged duplicate lines for {merged} cart products'))
+        carts = Cart.objects.all()
+        if not options['include_ordered']:
+            carts = carts.filter(in_order=False)
+        # Collect the ids first so repairs never write to the tables a live cursor is still reading.
+        drifted_ids = list(drifted_carts(carts).order_by('pk').values_list('pk', flat=True))
+        repaired = 0
+        for start in range(0, len(drifted_ids), REPAIR_CHUNK_SIZE):
+            chunk_ids = drifted_ids[start:start + REPAIR_CHUNK_SIZE]
+            with transaction.atomic():
+                # Lock the carts before totalling their lines, so a concurrent delta is not overwritten.
+                list(Cart.objects.select_for_update().filter(pk__in=chunk_ids).values_list('pk', flat=True))
+                changed = []
+                for cart in drifted_carts(Cart.objects.filter(pk__in=chunk_ids)).order_by('pk'):
+                    self.stdout.write(
+                        f'Cart {cart.pk}: stored {cart.final_price}/{cart.total_products}, '
+                        f'lines {cart.lines_price}/{cart.lines_count}'
+                    )
+                    cart.final_price = cart.lines_price
+                    cart.total_products = cart.lines_count
+                    changed.append(cart)
+                if not options['dry_run']:
+                    Cart.objects.bulk_update(changed, ['final_price', 'total_products'])
+                    repaired += len(changed)
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} carts'))
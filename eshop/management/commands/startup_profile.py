@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter so nothing is already imported, and reports how long each boot stage took.
+STARTUP_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+stages = {}
+def stage(name, since):
+    now = time.perf_counter()
+    stages[name] = round((now - since) * 1000, 3)
+    return now
+import django
+mark = stage('import_django', started)
+django.setup()
+mark = stage('setup', mark)
+from django.conf import settings
+from django.urls import get_resolver, reverse
+__import__(settings.ROOT_URLCONF)
+mark = stage('import_urlconf', mark)
+resolver = get_resolver()
+resolver.reverse_dict
+mark = stage('url_resolver', mark)
+reverse('base')
+mark = stage('first_reverse', mark)
+from django.template import engines
+engines.all()
+mark = stage('template_engines', mark)
+stages['total'] = round((mark - started) * 1000, 3)
+print(json.dumps({'stages': stages, 'modules': sorted(sys.modules)}))
+'''
+
+
+def parse_importtime(output):
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append({'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+    return modules
+
+
+def summarize_packages(modules):
+    packages = defaultdict(int)
+    for module in modules:
+        packages[module['module'].split('.')[0]] += module['self_us']
+    return dict(packages)
+
+
+class Command(BaseCommand):
+    help = 'Boot the project in a fresh interpreter and report import time per package and URL resolver warmup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=15, help='Packages and modules to list')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if process.returncode:
+            raise CommandError(f'Startup failed:\n{process.stderr[-2000:]}')
+        result = json.loads(process.stdout.splitlines()[-1])
+        modules = parse_importtime(process.stderr)
+        packages = summarize_packages(modules)
+        report = {
+            'stages': result['stages'],
+            'import_ms': round(sum(packages.values()) / 1000, 3),
+            'packages': {
+                name: round(us / 1000, 3)
+                for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)
+            },
+            'slowest_modules': [
+                {'module': module['module'], 'cumulative_ms': round(module['cumulative_us'] / 1000, 3)}
+                for module in sorted(modules, key=lambda module: module['cumulative_us'], reverse=True)
+            ][:options['limit']],
+            'loaded': sorted({name.split('.')[0] for name in result['modules']})
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write('Startup stages:')
+        for name, elapsed in report['stages'].items():
+            self.stdout.write(f'  {name:<20} {elapsed:10.1f} ms')
+        self.stdout.write(f"Import time by package (self time, {report['import_ms']:.1f} ms in total):")
+        for name, elapsed in list(report['packages'].items())[:options['limit']]:
+            self.stdout.write(f'  {name:<30} {elapsed:10.1f} ms')
+        self.stdout.write('Slowest imports (cumulative):')
+        for module in report['slowest_modules']:
+            self.stdout.write(f"  {module['module']:<50} {module['cumulative_ms']:10.1f} ms")
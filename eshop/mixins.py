@@ -1,23 +1,116 @@
+import hashlib
+from calendar import timegm
+
+from django.contrib.messages import get_messages
+from django.contrib.sessions.backends.signed_cookies import SessionStore as SignedCookieSession
+from django.utils.cache import get_conditional_response
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
 from django.views.generic import View
 
-from .models import Cart, Customer
+from .models import Cart
+from .utils import CART_SESSION_KEY, CART_TOTAL_SESSION_KEY, get_catalog_version, get_customer_cart, remember_cart
+
+
+def get_request_cart(request, create=False):
+    session = getattr(request, 'session', {})
+    cart_id = session.get(CART_SESSION_KEY)
+    cart = None
+    if cart_id:
+        carts = Cart.objects.select_related('owner').filter(pk=cart_id, in_order=False)
+        if request.user.is_authenticated:
+            cart = carts.filter(owner__user=request.user).first()
+        else:
+            cart = carts.filter(owner__isnull=True).first()
+    if cart is None:
+        if request.user.is_authenticated:
+            cart = get_customer_cart(request.user)
+        elif not create:
+            # Reads render an unsaved empty cart, the first cart mutation creates the row and the session.
+            cart = Cart(for_anonymous_user=True)
+        elif isinstance(session, SignedCookieSession):
+            # Signed cookie sessions have no stable key, the cart id stored in the session identifies the cart.
+            cart = Cart.objects.create(for_anonymous_user=True)
+        else:
+            if session.session_key is None:
+                session.create()
+            cart, created = Cart.objects.get_or_create(
+                session_key=session.session_key, in_order=False, for_anonymous_user=True
+            )
+    return cart
 
 
 class CartMixin(View):
 
+    create_cart = False
+
     def dispatch(self, request, *args, **kwargs):
-        if request.user.is_authenticated:
-            customer = Customer.objects.filter(user=request.user).first()
-            if not customer:
-                customer = Customer.objects.create(
-                    user=request.user
-                )
-            cart = Cart.objects.filter(owner=customer, in_order=False).first()
-            if not cart:
-                cart = Cart.objects.create(owner=customer)
-        else:
-            cart = Cart.objects.filter(for_anonymous_user=True).first()
-            if not cart:
-                cart = Cart.objects.create(for_anonymous_user=True)
-        self.cart = cart
-        return super().dispatch(request, *args, **kwargs)
+        self.cart = SimpleLazyObject(self.get_cart)
+        response = super().dispatch(request, *args, **kwargs)
+        resolved_cart = getattr(self, '_resolved_cart', None)
+        if resolved_cart is not None and hasattr(request, 'session'):
+            remember_cart(request.session, resolved_cart)
+        return response
+
+    def get_cart(self):
+        self._resolved_cart = get_request_cart(self.request, create=self.create_cart)
+        return self._resolved_cart
+
+
+def product_modified_at(product):
+    return max(product.updated_at, product.category.updated_at)
+
+
+def category_modified_at(category):
+    # Expects the products_updated_at annotation, Max('product__updated_at').
+    return max(category.updated_at, category.products_updated_at or category.updated_at)
+
+
+def get_validators(request, modified_at):
+    has_messages = bool(len(get_messages(request)))
+    etag = None
+    if not has_messages:
+        parts = [
+            modified_at.isoformat(),
+            get_language(),
+            str(get_catalog_version()),
+            str(request.user.pk),
+            str(request.session.get(CART_TOTAL_SESSION_KEY, 0)),
+            request.get_full_path()
+        ]
+        etag = quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
+    last_modified = None
+    # Personalised pages can only be validated by ETag, which covers the user and the cart badge.
+    if not (request.user.is_authenticated or request.session.get(CART_TOTAL_SESSION_KEY) or has_messages):
+        last_modified = timegm(modified_at.utctimetuple())
+    return {'etag': etag, 'last_modified': last_modified}
+
+
+def add_validator_headers(response, validators):
+    if validators['last_modified'] and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(validators['last_modified'])
+    if validators['etag']:
+        response.setdefault('ETag', validators['etag'])
+    return response
+
+
+class ConditionalDetailMixin(View):
+
+    def get_modified_at(self, obj):
+        return obj.updated_at
+
+    def get_object(self, queryset=None):
+        if queryset is None and getattr(self, 'conditional_object', None) is not None:
+            return self.conditional_object
+        return super().get_object(queryset)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        self.conditional_object = self.get_object()
+        validators = get_validators(request, self.get_modified_at(self.conditional_object))
+        response = get_conditional_response(request, **validators)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        return add_validator_headers(response, validators)
@@ -10,6 +10,7 @@ User = get_user_model()
 class Category(models.Model):
     name = models.CharField(max_length=255, verbose_name=_('Category name'))
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Updated'))
 
     def __str__(self):
         return self.name
@@ -25,6 +26,14 @@ class Product(models.Model):
     image = models.ImageField(verbose_name=_('Image'))
     description = models.TextField(verbose_name=_('Description'), null=True)
     price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name=_('Price'))
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Updated'))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'price', 'id']),
+            models.Index(fields=['category', 'title', 'id']),
+        ]
 
     def __str__(self):
         return self.title
@@ -33,13 +42,29 @@ class Product(models.Model):
         return reverse('product_detail', kwargs={'slug': self.slug})
 
 
+class ProductAttribute(models.Model):
+    product = models.ForeignKey(Product, verbose_name=_('Product'), related_name='attributes', on_delete=models.CASCADE)
+    name = models.CharField(max_length=100, verbose_name=_('Attribute'))
+    value = models.CharField(max_length=255, verbose_name=_('Value'))
+
+    class Meta:
+        indexes = [models.Index(fields=['name', 'value', 'product'])]
+        constraints = [models.UniqueConstraint(fields=['product', 'name', 'value'], name='unique_product_attribute')]
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 class CartProduct(models.Model):
-    user = models.ForeignKey('Customer', verbose_name=_('Customer'), on_delete=models.CASCADE)
+    user = models.ForeignKey('Customer', null=True, blank=True, verbose_name=_('Customer'), on_delete=models.CASCADE)
     cart = models.ForeignKey('Cart', verbose_name=_('Cart'), on_delete=models.CASCADE, related_name='related_products')
     product = models.ForeignKey(Product, verbose_name=_('Product'), on_delete=models.CASCADE)
     qty = models.PositiveIntegerField(default=1, verbose_name=_('Quantity'))
     final_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name=_('Total price'))
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product')]
+
     def __str__(self):
         return f"Product: {self.product.title} (for cart)"
 
@@ -55,6 +80,13 @@ class Cart(models.Model):
     final_price = models.DecimalField(max_digits=9, default=0, decimal_places=2, verbose_name=_('Total price'))
     in_order = models.BooleanField(default=False)
     for_anonymous_user = models.BooleanField(default=False)
+    session_key = models.CharField(max_length=40, null=True, blank=True, db_index=True)
+    payment_intent_id = models.CharField(max_length=255, null=True, blank=True)
+    payment_intent_amount = models.PositiveIntegerField(null=True, blank=True)
+    payment_client_secret = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['owner', 'in_order'], name='cart_owner_in_order_idx')]
 
     def __str__(self):
         return str(self.id)
@@ -64,7 +96,6 @@ class Customer(models.Model):
     user = models.ForeignKey(User, verbose_name=_('User'), on_delete=models.CASCADE)
     phone = models.CharField(max_length=20, verbose_name=_('Phone'))
     address = models.CharField(max_length=255, verbose_name=_('Address'))
-    orders = models.ManyToManyField('Order', blank=True, verbose_name=_('customer orders'), related_name='related_order')
 
     def __str__(self):
         return f"Buyer: {self.user.first_name} {self.user.last_name}"
@@ -98,7 +129,7 @@ class Order(models.Model):
     first_name = models.CharField(max_length=255, verbose_name=_('first_name'))
     last_name = models.CharField(max_length=255, verbose_name=_('last_name'))
     phone = models.CharField(max_length=20, verbose_name=_('Phone'))
-    cart = models.ForeignKey(Cart, verbose_name=_('Cart'), on_delete=models.CASCADE, null=True, blank=True)
+    cart = models.ForeignKey(Cart, verbose_name=_('Cart'), on_delete=models.SET_NULL, null=True, blank=True)
     address = models.CharField(max_length=1024, verbose_name=_('Address'))
     status = models.CharField(
         max_length=100,
@@ -113,8 +144,27 @@ class Order(models.Model):
         default=BUYING_TYPE_SELF
     )
     comment = models.TextField(verbose_name=_('Commentary'), null=True, blank=True)
+    total_products = models.PositiveIntegerField(default=0, verbose_name=_('Total products'))
+    final_price = models.DecimalField(max_digits=9, default=0, decimal_places=2, verbose_name=_('Total price'))
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now=True, verbose_name=_('Order created'))
     order_date = models.DateField(verbose_name=_('Order completed'), default=timezone.now)
 
+    class Meta:
+        indexes = [models.Index(fields=['customer', '-created_at'], name='order_customer_created_idx')]
+
     def __str__(self):
         return str(self.id)
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, verbose_name=_('Order'), related_name='lines', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name=_('Product'), null=True, blank=True, on_delete=models.SET_NULL)
+    title = models.CharField(max_length=255, verbose_name=_('Title'))
+    image = models.ImageField(verbose_name=_('Image'), blank=True)
+    unit_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name=_('Price'))
+    qty = models.PositiveIntegerField(default=1, verbose_name=_('Quantity'))
+    final_price = models.DecimalField(max_digits=9, decimal_places=2, verbose_name=_('Total price'))
+
+    def __str__(self):
+        return f"{self.title} x {self.qty} (order {self.order_id})"
@@ -0,0 +1,99 @@
+import uuid
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Cart
+from .profiling import profile_span
+
+
+PaymentIntent = namedtuple('PaymentIntent', ['id', 'client_secret', 'amount'])
+
+
+class StripeGateway:
+    # stripe is imported on first use, it is the slowest import on the startup path.
+
+    def create_intent(self, amount, currency, metadata=None, idempotency_key=None):
+        import stripe
+        intent = stripe.PaymentIntent.create(
+            amount=amount,
+            currency=currency,
+            metadata=metadata or {},
+            idempotency_key=idempotency_key,
+            api_key=settings.STRIPE_SECRET_KEY
+        )
+        return PaymentIntent(intent.id, intent.client_secret, intent.amount)
+
+    def update_intent(self, intent_id, amount):
+        import stripe
+        intent = stripe.PaymentIntent.modify(intent_id, amount=amount, api_key=settings.STRIPE_SECRET_KEY)
+        return PaymentIntent(intent.id, intent.client_secret, intent.amount)
+
+
+class FakeGateway:
+
+    def __init__(self):
+        self.intents = {}
+        self.idempotency_keys = {}
+
+    def create_intent(self, amount, currency, metadata=None, idempotency_key=None):
+        if idempotency_key in self.idempotency_keys:
+            return self.intents[self.idempotency_keys[idempotency_key]]
+        intent_id = f'pi_fake_{uuid.uuid4().hex}'
+        intent = PaymentIntent(intent_id, f'{intent_id}_secret_{uuid.uuid4().hex}', amount)
+        self.intents[intent_id] = intent
+        if idempotency_key:
+            self.idempotency_keys[idempotency_key] = intent_id
+        return intent
+
+    def update_intent(self, intent_id, amount):
+        intent = self.intents[intent_id]._replace(amount=amount)
+        self.intents[intent_id] = intent
+        return intent
+
+
+@lru_cache(maxsize=None)
+def load_payment_gateway(path):
+    return import_string(path)()
+
+
+def get_payment_gateway():
+    return load_payment_gateway(settings.PAYMENT_GATEWAY)
+
+
+def request_payment_intent(cart):
+    if cart.pk is None:
+        return None
+    amount = int(cart.final_price * 100)
+    if cart.payment_intent_id and cart.payment_intent_amount == amount:
+        return None
+    gateway = get_payment_gateway()
+    with profile_span('payment'):
+        if cart.payment_intent_id:
+            return gateway.update_intent(cart.payment_intent_id, amount)
+        return gateway.create_intent(
+            amount,
+            settings.PAYMENT_CURRENCY,
+            metadata={'integration_check': 'accept_a_payment', 'cart_id': cart.pk},
+            idempotency_key=f'cart-{cart.pk}-payment-intent'
+        )
+
+
+def store_payment_intent(cart, intent):
+    cart.payment_intent_id = intent.id
+    cart.payment_intent_amount = intent.amount
+    cart.payment_client_secret = intent.client_secret
+    Cart.objects.filter(pk=cart.pk).update(
+        payment_intent_id=intent.id,
+        payment_intent_amount=intent.amount,
+        payment_client_secret=intent.client_secret
+    )
+
+
+def get_cart_payment_secret(cart):
+    intent = request_payment_intent(cart)
+    if intent is not None:
+        store_payment_intent(cart, intent)
+    return cart.payment_client_secret
@@ -0,0 +1,134 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+
+logger = logging.getLogger(__name__)
+
+current_profile = ContextVar('eshop_request_profile', default=None)
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = Counter()
+        self.spans = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def add_span(self, name, duration):
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def repeated_queries(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+@contextmanager
+def profile_span(name):
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(name, time.perf_counter() - started)
+
+
+class ProfiledTemplate(Template):
+
+    def render(self, context=None, request=None):
+        with profile_span('template'):
+            return super().render(context, request)
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def server_timing(profile, total):
+    metrics = [
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={profile.query_time * 1000:.1f};desc="{profile.queries} queries"',
+    ]
+    metrics.extend(f'{name};dur={duration * 1000:.1f}' for name, duration in sorted(profile.spans.items()))
+    return ', '.join(metrics)
+
+
+class RequestProfilingMiddleware:
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        total = profile.total_time
+        response['Server-Timing'] = server_timing(profile, total)
+        self.report(request, response, profile, total)
+        return response
+
+    def report(self, request, response, profile, total):
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else None
+        repeated = profile.repeated_queries(settings.REQUEST_PROFILING_REPEATED_QUERIES)
+        for sql, count in repeated:
+            logger.warning('Repeated query in %s (%s times): %s', view_name, count, sql)
+        slow = (
+            total * 1000 >= settings.REQUEST_PROFILING_SLOW_MS
+            or profile.queries >= settings.REQUEST_PROFILING_SLOW_QUERIES
+        )
+        if slow:
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'view': view_name,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 1),
+                'db_ms': round(profile.query_time * 1000, 1),
+                'queries': profile.queries,
+                'spans_ms': {name: round(duration * 1000, 1) for name, duration in profile.spans.items()},
+                'repeated_queries': [{'sql': sql, 'count': count} for sql, count in repeated]
+            }
+            logger.warning('Slow request: %s', json.dumps(record), extra={'profile': record})
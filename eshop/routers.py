@@ -0,0 +1,27 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+CATALOG_DATABASE = 'catalog'
+CATALOG_MODELS = {'category', 'product', 'productattribute'}
+
+
+class CatalogReadRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'eshop' or model._meta.model_name not in CATALOG_MODELS:
+            return None
+        # Reads inside a transaction stay on the writer so they see its own uncommitted changes.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return CATALOG_DATABASE
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, CATALOG_DATABASE}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != CATALOG_DATABASE
@@ -0,0 +1,84 @@
+import re
+from functools import reduce
+from operator import and_
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+
+SEARCH_TABLE = 'eshop_product_search'
+
+
+def search_index_supported():
+    return connection.vendor == 'sqlite'
+
+
+def create_search_index():
+    if not search_index_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5(title, description, category, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def index_products(products):
+    if not search_index_supported():
+        return
+    rows = [(product.pk, product.title, product.description or '', product.category.name) for product in products]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, category) VALUES (%s, %s, %s, %s)", rows
+        )
+
+
+def remove_products(product_ids):
+    if not search_index_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+
+def clear_search_index():
+    if not search_index_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def search_products(query, page=1, page_size=24):
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+    offset = (page - 1) * page_size
+    if not search_index_supported():
+        conditions = [
+            Q(title__icontains=term) | Q(description__icontains=term) | Q(category__name__icontains=term)
+            for term in terms
+        ]
+        products = list(
+            Product.objects.filter(reduce(and_, conditions)).order_by('title', 'pk')[offset:offset + page_size + 1]
+        )
+        return products[:page_size], len(products) > page_size
+    match = ' '.join(f'"{term}"*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, 10.0, 1.0, 3.0) LIMIT %s OFFSET %s",
+            [match, page_size + 1, offset]
+        )
+        product_ids = [row[0] for row in cursor.fetchall()]
+    has_next = len(product_ids) > page_size
+    product_ids = product_ids[:page_size]
+    products = Product.objects.in_bulk(product_ids)
+    return [products[pk] for pk in product_ids if pk in products], has_next
@@ -26,12 +26,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'eshop',
+    'eshop.apps.eshopConfig',
     'crispy_forms',
-    'rosetta',
 ]
 
+# The translation UI is only needed where translators work, so production workers skip loading it.
+ENABLE_ROSETTA = os.environ.get('ENABLE_ROSETTA', '1' if DEBUG else '0') == '1'
+
+if ENABLE_ROSETTA:
+    INSTALLED_APPS.append('rosetta')
+
 MIDDLEWARE = [
+    'eshop.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -46,7 +52,7 @@ ROOT_URLCONF = 'eshop.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'eshop.profiling.ProfilingDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -55,6 +61,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'eshop.context_processors.cart_badge',
+                'eshop.context_processors.catalog',
             ],
         },
     },
@@ -62,17 +70,105 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'eshop.wsgi.application'
 
+# Per-request SQL and timing instrumentation (Server-Timing header, slow request and repeated query logs).
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING') == '1'
+REQUEST_PROFILING_SLOW_MS = int(os.environ.get('REQUEST_PROFILING_SLOW_MS', 500))
+REQUEST_PROFILING_SLOW_QUERIES = int(os.environ.get('REQUEST_PROFILING_SLOW_QUERIES', 50))
+REQUEST_PROFILING_REPEATED_QUERIES = int(os.environ.get('REQUEST_PROFILING_REPEATED_QUERIES', 5))
+
+# Serve the catalog and cart routes with the async views in eshop/async_views.py (useful under eshop/asgi.py).
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3'))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': 'eshop.backends.sqlite3',
+        'NAME': SQLITE_PATH,
     }
 }
 
+# eshop.backends.sqlite3 opens write transactions with BEGIN IMMEDIATE so concurrent writers wait for the lock.
+# SQLITE_PROFILE=production turns on WAL journaling, a busy timeout, persistent connections and a
+# read-only 'catalog' connection that CatalogReadRouter uses for catalog reads outside transactions.
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'development')
+SQLITE_PRAGMAS = {}
+if SQLITE_PROFILE == 'production':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'temp_store': 'MEMORY',
+        'cache_size': -20000,
+    }
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+    })
+    DATABASES['catalog'] = {
+        'ENGINE': 'eshop.backends.sqlite3',
+        'NAME': f'file:{SQLITE_PATH}?mode=ro',
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['eshop.routers.CatalogReadRouter']
+
+
+# Caches and sessions
+# Sessions stay off the database by default: 'signed_cookies' keeps them client side, 'cache' keeps them in
+# the 'sessions' cache, 'cached_db' and 'db' use the legacy django_session table. 'cache' needs a cache every
+# worker shares, SESSION_CACHE_BACKEND=memcached (python-memcached, SESSION_CACHE_LOCATION=host:port);
+# 'locmem' only suits a single development process.
+
+SESSION_STORE = os.environ.get('SESSION_STORE', 'signed_cookies')
+SESSION_ENGINE = {
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'db': 'django.contrib.sessions.backends.db',
+}[SESSION_STORE]
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_CACHE_BACKEND = os.environ.get('SESSION_CACHE_BACKEND', 'memcached')
+
+# The default cache holds state every worker has to agree on: the navigation cache, the catalog version
+# behind fragment caching and ETags, and the login throttle counters. locmem is private to one process, so
+# deployments with more than one worker, or that run import_catalog next to the web server, must use
+# CACHE_BACKEND=memcached (python-memcached, CACHE_LOCATION=host:port). check --deploy warns otherwise.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'memcached': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', '127.0.0.1:11211'),
+            'KEY_PREFIX': 'eshop',
+        },
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }[CACHE_BACKEND],
+}
+if SESSION_STORE in ('cache', 'cached_db'):
+    CACHES['sessions'] = {
+        'memcached': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', '127.0.0.1:11211'),
+        },
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sessions',
+            'TIMEOUT': None,
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }[SESSION_CACHE_BACKEND]
+
+# Flash messages travel in a cookie instead of falling back to the session.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -92,6 +188,12 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Failed logins are counted in the default cache; once a limit is reached, further attempts are
+# refused before any password hashing until the window expires.
+LOGIN_ATTEMPT_LIMIT = int(os.environ.get('LOGIN_ATTEMPT_LIMIT', 5))
+LOGIN_ATTEMPT_IP_LIMIT = int(os.environ.get('LOGIN_ATTEMPT_IP_LIMIT', 20))
+LOGIN_ATTEMPT_WINDOW = int(os.environ.get('LOGIN_ATTEMPT_WINDOW', 15 * 60))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.0/topics/i18n/
@@ -125,3 +227,19 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
+
+# Product image variants (thumbnails and WebP copies stored next to the original upload)
+
+IMAGE_VARIANT_WIDTHS = (200, 400, 800)
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANTS_ASYNC = True
+
+# Payments
+# Set PAYMENT_GATEWAY to 'eshop.payments.FakeGateway' to run without calling Stripe (tests, load runs).
+
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'eshop.payments.StripeGateway')
+PAYMENT_CURRENCY = 'eur'
+STRIPE_SECRET_KEY = os.environ.get(
+    'STRIPE_SECRET_KEY',
+    'sk_test_51IMdwRIpP4Nmj1V1cgpIgJwJvLhr5o36DJdqceJLrg77gSsDJODfMtLcg6Bux732fRSZJsKdb6WHFB8OAK7eMD1H00WlNCUqGm'
+)
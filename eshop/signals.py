@@ -0,0 +1,77 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .db import configure_sqlite_connection
+from .models import Cart, Category, Product, ProductAttribute
+from .images import schedule_image_variants
+from .search import create_search_index, index_products, remove_products
+from .utils import (
+    CART_SESSION_KEY,
+    bump_catalog_version,
+    get_customer_cart,
+    invalidate_navigation_categories,
+    merge_carts,
+    remember_cart
+)
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_catalog_caches(sender, **kwargs):
+    invalidate_navigation_categories()
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=ProductAttribute)
+def touch_attribute_product(sender, instance, **kwargs):
+    # Attributes feed the facets and the product page, so an edit counts as a change of its product.
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    index_products([instance])
+
+
+@receiver(post_save, sender=Product)
+def generate_product_image_variants(sender, instance, **kwargs):
+    schedule_image_variants(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    if not created:
+        index_products(instance.product_set.select_related('category').iterator())
+
+
+@receiver(post_migrate)
+def create_product_search_index(sender, **kwargs):
+    if sender.name == 'eshop':
+        create_search_index()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    configure_sqlite_connection(connection)
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is None or not hasattr(request, 'session'):
+        return
+    cart = get_customer_cart(user)
+    cart_id = request.session.get(CART_SESSION_KEY)
+    if cart_id and cart_id != cart.pk:
+        anonymous_cart = Cart.objects.filter(pk=cart_id, owner__isnull=True, in_order=False).first()
+        if anonymous_cart is not None:
+            merge_carts(anonymous_cart, cart)
+    remember_cart(request.session, cart)
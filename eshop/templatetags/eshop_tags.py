@@ -0,0 +1,11 @@
+from django import template
+
+from eshop.images import image_srcset as build_image_srcset
+
+
+register = template.Library()
+
+
+@register.filter
+def image_srcset(product, extension=''):
+    return build_image_srcset(product, extension or None)
@@ -6,9 +6,12 @@ from django.contrib.auth.views import LogoutView
 from django.conf.urls.i18n import i18n_patterns
 from .views import (
     BaseView,
+    ProductListJsonView,
     ProductDetailView,
     CategoryDetailView,
+    SearchView,
     CartView,
+    CartBatchView,
     AddToCartView,
     DeleteFromCartView,
     ChangeQTYView,
@@ -20,25 +23,53 @@ from .views import (
     PaidOnlineOrderView
 )
 
+if settings.ASYNC_VIEWS:
+    from .async_views import (
+        base_view,
+        product_detail_view,
+        category_detail_view,
+        cart_view,
+        cart_batch_view,
+        add_to_cart_view,
+        delete_from_cart_view,
+        change_qty_view,
+        checkout_view
+    )
+else:
+    base_view = BaseView.as_view()
+    product_detail_view = ProductDetailView.as_view()
+    category_detail_view = CategoryDetailView.as_view()
+    cart_view = CartView.as_view()
+    cart_batch_view = CartBatchView.as_view()
+    add_to_cart_view = AddToCartView.as_view()
+    delete_from_cart_view = DeleteFromCartView.as_view()
+    change_qty_view = ChangeQTYView.as_view()
+    checkout_view = CheckoutView.as_view()
+
 urlpatterns = i18n_patterns(
     path('admin/', admin.site.urls),
-    path('', BaseView.as_view(), name='base'),
-    path('products/<str:slug>/', ProductDetailView.as_view(), name='product_detail'),
-    path('category/<str:slug>/', CategoryDetailView.as_view(), name='category_detail'),
-    path('cart/', CartView.as_view(), name='cart'),
-    path('add-to-cart/<str:slug>/', AddToCartView.as_view(), name='add_to_cart'),
-    path('remove-from-cart/<str:slug>/', DeleteFromCartView.as_view(), name='delete_from_cart'),
-    path('change-qty/<str:slug>/', ChangeQTYView.as_view(), name='change_qty'),
-    path('checkout/', CheckoutView.as_view(), name='checkout'),
+    path('', base_view, name='base'),
+    path('api/products/', ProductListJsonView.as_view(), name='product_list_json'),
+    path('products/<str:slug>/', product_detail_view, name='product_detail'),
+    path('category/<str:slug>/', category_detail_view, name='category_detail'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('cart/', cart_view, name='cart'),
+    path('cart/batch/', cart_batch_view, name='cart_batch'),
+    path('add-to-cart/<str:slug>/', add_to_cart_view, name='add_to_cart'),
+    path('remove-from-cart/<str:slug>/', delete_from_cart_view, name='delete_from_cart'),
+    path('change-qty/<str:slug>/', change_qty_view, name='change_qty'),
+    path('checkout/', checkout_view, name='checkout'),
     path('make-order/', MakeOrderView.as_view(), name='make_order'),
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(next_page='/'), name='logout'),
     path('registration/', RegistrationView.as_view(), name='registration'),
     path('profile/', ProfileView.as_view(), name='profile'),
     path('paid-online-order/', PaidOnlineOrderView.as_view(), name='paid_online'),
-    path('rosetta/', include('rosetta.urls')),
 )
 
+if settings.ENABLE_ROSETTA:
+    urlpatterns += i18n_patterns(path('rosetta/', include('rosetta.urls')))
+
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,4 +1,29 @@
-from django.db import models
+import base64
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import get_language
+
+from .models import Cart, CartProduct, Category, Customer, Order, OrderLine, Product
+
+
+CART_SESSION_KEY = 'cart_id'
+CART_TOTAL_SESSION_KEY = 'cart_total_products'
+
+CART_CONFLICT_RETRIES = 2
+
+NAVIGATION_CACHE_KEY = 'eshop:navigation:{language}'
+NAVIGATION_CACHE_TIMEOUT = 60 * 60
+CATALOG_VERSION_KEY = 'eshop:catalog_version'
+LOGIN_ATTEMPTS_USER_KEY = 'eshop:login_attempts:user:{digest}'
+LOGIN_ATTEMPTS_IP_KEY = 'eshop:login_attempts:ip:{digest}'
 
 
 def recalc_cart(cart):
@@ -8,4 +33,330 @@ def recalc_cart(cart):
     else:
         cart.final_price = 0
     cart.total_products = cart_data['id__count']
-    cart.save()
\ No newline at end of file
+    cart.save()
+
+
+def apply_cart_delta(cart, price_delta, products_delta):
+    Cart.objects.filter(pk=cart.pk).update(
+        final_price=models.F('final_price') + price_delta,
+        total_products=models.F('total_products') + products_delta
+    )
+    cart.refresh_from_db(fields=['final_price', 'total_products'])
+
+
+@transaction.atomic
+def add_cart_product(cart, product):
+    cart_product, created = CartProduct.objects.get_or_create(
+        cart=cart, product=product, defaults={'user': cart.owner}
+    )
+    if created:
+        cart.products.add(cart_product)
+        apply_cart_delta(cart, cart_product.final_price, 1)
+    return cart_product
+
+
+@transaction.atomic
+def remove_cart_product(cart, product):
+    cart_product = CartProduct.objects.select_for_update().get(cart=cart, product=product)
+    cart.products.remove(cart_product)
+    cart_product.delete()
+    apply_cart_delta(cart, -cart_product.final_price, -1)
+
+
+def parse_cart_qty(value):
+    try:
+        qty = int(value)
+    except (TypeError, ValueError):
+        return None
+    return qty if qty >= 1 else None
+
+
+@transaction.atomic
+def change_cart_product_qty(cart, product, qty):
+    if qty < 1:
+        raise ValueError('Quantity must be at least 1')
+    cart_product = CartProduct.objects.select_for_update().get(cart=cart, product=product)
+    final_price = qty * product.price
+    CartProduct.objects.filter(pk=cart_product.pk).update(qty=qty, final_price=final_price)
+    apply_cart_delta(cart, final_price - cart_product.final_price, 0)
+
+
+def update_cart_products(cart, quantities):
+    for attempt in range(CART_CONFLICT_RETRIES):
+        try:
+            return apply_cart_products(cart, quantities)
+        except IntegrityError:
+            # A concurrent request inserted one of the new lines first; the batch rolled back, so rerun it.
+            if attempt == CART_CONFLICT_RETRIES - 1:
+                raise
+
+
+@transaction.atomic
+def apply_cart_products(cart, quantities):
+    products = {product.slug: product for product in Product.objects.filter(slug__in=quantities)}
+    missing = sorted(set(quantities) - set(products))
+    if missing:
+        raise Product.DoesNotExist(f"Unknown products: {', '.join(missing)}")
+    lines = {
+        line.product_id: line
+        for line in CartProduct.objects.select_for_update().filter(cart=cart, product__in=products.values())
+    }
+    new_lines = []
+    changed_lines = []
+    removed_ids = []
+    price_delta = 0
+    products_delta = 0
+    for slug, qty in quantities.items():
+        product = products[slug]
+        line = lines.get(product.pk)
+        if not qty:
+            if line is not None:
+                removed_ids.append(line.pk)
+                price_delta -= line.final_price
+                products_delta -= 1
+        elif line is None:
+            line = CartProduct(user=cart.owner, cart=cart, product=product, qty=qty, final_price=qty * product.price)
+            new_lines.append(line)
+            price_delta += line.final_price
+            products_delta += 1
+        elif line.qty != qty:
+            final_price = qty * product.price
+            price_delta += final_price - line.final_price
+            line.qty = qty
+            line.final_price = final_price
+            changed_lines.append(line)
+    if removed_ids:
+        Cart.products.through.objects.filter(cart=cart, cartproduct_id__in=removed_ids).delete()
+        CartProduct.objects.filter(pk__in=removed_ids).delete()
+    if changed_lines:
+        CartProduct.objects.bulk_update(changed_lines, ['qty', 'final_price'])
+    if new_lines:
+        CartProduct.objects.bulk_create(new_lines)
+        new_ids = CartProduct.objects.filter(
+            cart=cart, product__in=[line.product for line in new_lines]
+        ).values_list('pk', flat=True)
+        Cart.products.through.objects.bulk_create([
+            Cart.products.through(cart_id=cart.pk, cartproduct_id=pk) for pk in new_ids
+        ])
+    if price_delta or products_delta:
+        apply_cart_delta(cart, price_delta, products_delta)
+    return cart
+
+
+def build_order_lines(cart):
+    # Both prices come from the cart line, priced when it was added, so unit, line and order totals agree.
+    lines = []
+    for item in cart.related_products.select_related('product'):
+        qty = max(item.qty, 1)
+        lines.append(OrderLine(
+            product=item.product,
+            title=item.product.title,
+            image=item.product.image.name,
+            unit_price=(item.final_price / qty).quantize(Decimal('0.01')),
+            qty=qty,
+            final_price=item.final_price
+        ))
+    return lines
+
+
+def create_order_lines(order, lines):
+    for line in lines:
+        line.order = order
+    return OrderLine.objects.bulk_create(lines)
+
+
+@transaction.atomic
+def place_order(cart, order):
+    order.idempotency_key = f'cart-{cart.pk}'
+    # The conditional update claims the cart and takes the write lock; a duplicate submission claims nothing.
+    if not Cart.objects.filter(pk=cart.pk, in_order=False, total_products__gt=0).update(in_order=True):
+        return Order.objects.filter(idempotency_key=order.idempotency_key).first(), False
+    cart.refresh_from_db(fields=['in_order', 'total_products', 'final_price'])
+    lines = build_order_lines(cart)
+    order.cart = cart
+    order.total_products = len(lines)
+    order.final_price = sum((line.final_price for line in lines), Decimal(0))
+    order.save(force_insert=True)
+    create_order_lines(order, lines)
+    return order, True
+
+
+def remember_cart(session, cart):
+    if cart.pk is None or cart.in_order:
+        session.pop(CART_SESSION_KEY, None)
+        session.pop(CART_TOTAL_SESSION_KEY, None)
+        return
+    if session.get(CART_SESSION_KEY) != cart.pk:
+        session[CART_SESSION_KEY] = cart.pk
+    if session.get(CART_TOTAL_SESSION_KEY) != cart.total_products:
+        session[CART_TOTAL_SESSION_KEY] = cart.total_products
+
+
+def get_customer_cart(user):
+    customer = Customer.objects.filter(user=user).first()
+    if not customer:
+        customer = Customer.objects.create(user=user)
+    cart = Cart.objects.filter(owner=customer, in_order=False).first()
+    if not cart:
+        cart = Cart.objects.create(owner=customer)
+    return cart
+
+
+@transaction.atomic
+def merge_carts(source, target):
+    target_lines = {line.product_id: line for line in target.related_products.all()}
+    moved_ids = []
+    updated_lines = []
+    for line in source.related_products.select_related('product'):
+        existing = target_lines.get(line.product_id)
+        if existing is None:
+            moved_ids.append(line.pk)
+            continue
+        existing.qty += line.qty
+        existing.final_price = existing.qty * line.product.price
+        updated_lines.append(existing)
+    CartProduct.objects.bulk_update(updated_lines, ['qty', 'final_price'])
+    CartProduct.objects.filter(pk__in=moved_ids).update(cart=target, user=target.owner)
+    Cart.products.through.objects.filter(cart=source, cartproduct_id__in=moved_ids).update(cart=target)
+    source.delete()
+    recalc_cart(target)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=lambda value: value.isoformat() if hasattr(value, 'isoformat') else str(value))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+
+
+def cursor_values(model, fields, values):
+    # A tampered cursor can be well-formed JSON with values of the wrong type; treat it as no cursor.
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    converted = []
+    for field, value in zip(fields, values):
+        model_field = model._meta.pk if field == 'pk' else model._meta.get_field(field)
+        try:
+            value = model_field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            return None
+        if value is None or (isinstance(value, Decimal) and not value.is_finite()):
+            return None
+        converted.append(value)
+    return converted
+
+
+def keyset_paginate(queryset, ordering, cursor=None, page_size=20):
+    fields = [field.lstrip('-') for field in ordering]
+    queryset = queryset.order_by(*ordering)
+    values = cursor_values(queryset.model, fields, decode_cursor(cursor)) if cursor else None
+    if values is not None:
+        condition = Q()
+        for index, field in enumerate(fields):
+            lookup = 'lt' if ordering[index].startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[index]})
+            for previous_field, previous_value in zip(fields[:index], values[:index]):
+                step &= Q(**{previous_field: previous_value})
+            condition |= step
+        queryset = queryset.filter(condition)
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor([getattr(items[-1], field) for field in fields])
+    return items, next_cursor
+
+
+class KeysetPage:
+    """A keyset page that only queries on first use, so a cached template fragment that skips it costs nothing."""
+
+    def __init__(self, queryset, ordering, cursor=None, page_size=20):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.cursor = cursor
+        self.page_size = page_size
+
+    @cached_property
+    def cache_key(self):
+        # Only a cursor that decodes to valid values reaches fragment keys, re-encoded so equal cursors share one.
+        fields = [field.lstrip('-') for field in self.ordering]
+        values = cursor_values(self.queryset.model, fields, decode_cursor(self.cursor)) if self.cursor else None
+        return encode_cursor(values) if values is not None else ''
+
+    @cached_property
+    def result(self):
+        return keyset_paginate(self.queryset, self.ordering, self.cursor, self.page_size)
+
+    @property
+    def object_list(self):
+        return self.result[0]
+
+    @property
+    def next_cursor(self):
+        return self.result[1]
+
+
+def get_navigation_categories():
+    key = NAVIGATION_CACHE_KEY.format(language=get_language())
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(
+            Category.objects.annotate(product_count=models.Count('product')).order_by('pk')
+        )
+        cache.set(key, categories, NAVIGATION_CACHE_TIMEOUT)
+    return categories
+
+
+def invalidate_navigation_categories():
+    cache.delete_many([NAVIGATION_CACHE_KEY.format(language=code) for code, name in settings.LANGUAGES])
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+
+
+def login_attempt_keys(request, username):
+    # Hashed so arbitrary user input never ends up in a cache key.
+    user_digest = hashlib.md5((username or '').lower().encode()).hexdigest()
+    ip_digest = hashlib.md5(request.META.get('REMOTE_ADDR', '').encode()).hexdigest()
+    return LOGIN_ATTEMPTS_USER_KEY.format(digest=user_digest), LOGIN_ATTEMPTS_IP_KEY.format(digest=ip_digest)
+
+
+def login_attempts_exceeded(request, username):
+    user_key, ip_key = login_attempt_keys(request, username)
+    attempts = cache.get_many([user_key, ip_key])
+    return (
+        attempts.get(user_key, 0) >= settings.LOGIN_ATTEMPT_LIMIT
+        or attempts.get(ip_key, 0) >= settings.LOGIN_ATTEMPT_IP_LIMIT
+    )
+
+
+def record_failed_login(request, username):
+    for key in login_attempt_keys(request, username):
+        if not cache.add(key, 1, settings.LOGIN_ATTEMPT_WINDOW):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 1, settings.LOGIN_ATTEMPT_WINDOW)
+
+
+def reset_login_attempts(request, username):
+    user_key, ip_key = login_attempt_keys(request, username)
+    # The per-IP counter keeps running so one valid account cannot be used to reset it.
+    cache.delete(user_key)
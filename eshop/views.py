@@ -1,82 +1,148 @@
-from django.db import transaction
+import json
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max
 from django.shortcuts import render
+from django.urls import reverse
 from django.contrib import messages
 from django.utils.translation import get_language
-from django.contrib.auth import authenticate, login
+from django.contrib.auth import login
 from django.utils.translation import gettext_lazy as _
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.views.generic import DetailView, View
-from .models import Category, Customer, CartProduct, Product, Order
-from .mixins import CartMixin
+from .models import Category, Customer, Product, Order
+from .mixins import CartMixin, ConditionalDetailMixin, category_modified_at, product_modified_at
+from .filters import CategoryProductFilter
 from .forms import OrderForm, LoginForm, RegistrationForm
-from .utils import recalc_cart
-import stripe
+from .images import image_srcset
+from .payments import get_cart_payment_secret
+from .search import search_products
+from .utils import (
+    KeysetPage,
+    add_cart_product,
+    change_cart_product_qty,
+    get_navigation_categories,
+    keyset_paginate,
+    parse_cart_qty,
+    place_order,
+    remove_cart_product,
+    update_cart_products
+)
 
 
 class BaseView(CartMixin, View):
 
+    paginate_by = 24
+
+    def get_products_page(self):
+        return KeysetPage(Product.objects.all(), ('-id',), self.request.GET.get('cursor'), self.paginate_by)
+
     def get(self, request):
-        categories = Category.objects.all()
-        products = Product.objects.all()
+        categories = get_navigation_categories()
         context = {
             'categories': categories,
-            'products': products,
+            'page': self.get_products_page(),
             'cart': self.cart
         }
         return render(request, 'base.html', context)
 
 
-class ProductDetailView(CartMixin, DetailView):
+class ProductListJsonView(BaseView):
+
+    def get(self, request):
+        page = self.get_products_page()
+        return JsonResponse({
+            'products': [
+                {
+                    'slug': product.slug,
+                    'title': product.title,
+                    'price': str(product.price),
+                    'url': product.get_absolute_url(),
+                    'image': product.image.url,
+                    'srcset': image_srcset(product),
+                    'webp_srcset': image_srcset(product, '.webp'),
+                    'add_to_cart_url': reverse('add_to_cart', kwargs={'slug': product.slug})
+                }
+                for product in page.object_list
+            ],
+            'next_cursor': page.next_cursor
+        })
+
+
+class ProductDetailView(CartMixin, ConditionalDetailMixin, DetailView):
 
     model = Product
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related('category')
     context_object_name = 'product'
     template_name = 'product_detail.html'
     slug_url_kwarg = 'slug'
 
+    def get_modified_at(self, product):
+        return product_modified_at(product)
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = self.get_object().category.__class__.objects.all()
+        context['categories'] = get_navigation_categories()
         context['cart'] = self.cart
         return context
 
 
-class CategoryDetailView(CartMixin, DetailView):
+class CategoryDetailView(CartMixin, ConditionalDetailMixin, DetailView):
 
     model = Category
-    queryset = Category.objects.all()
+    queryset = Category.objects.annotate(products_updated_at=Max('product__updated_at'))
     context_object_name = 'category'
     template_name = 'category_detail.html'
     slug_url_kwarg = 'slug'
 
+    def get_modified_at(self, category):
+        return category_modified_at(category)
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(**kwargs)
-        category = self.get_object()
+        category = self.object
         context['cart'] = self.cart
-        context['categories'] = self.model.objects.all()
-        if not self.request.GET:
-            context['category_products'] = category.product_set.all()
-            return context
+        context['categories'] = get_navigation_categories()
         url_kwargs = {}
         for item in self.request.GET:
             if len(self.request.GET.getlist(item)) > 1:
                 url_kwargs[item] = self.request.GET.getlist(item)
             else:
                 url_kwargs[item] = self.request.GET.get(item)
+        context['product_filter'] = CategoryProductFilter(category, url_kwargs)
         return context
 
 
+class SearchView(CartMixin, View):
+
+    paginate_by = 24
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        products, has_next = search_products(query, page, self.paginate_by)
+        context = {
+            'query': query,
+            'products': products,
+            'page': page,
+            'has_next': has_next,
+            'cart': self.cart,
+            'categories': get_navigation_categories()
+        }
+        return render(request, 'search.html', context)
+
+
 class AddToCartView(CartMixin, View):
 
+    create_cart = True
+
     def get(self, request, *args, **kwargs):
         product_slug = kwargs.get('slug')
         product = Product.objects.get(slug=product_slug)
-        cart_product, created = CartProduct.objects.get_or_create(
-            user=self.cart.owner, cart=self.cart, product=product
-        )
-        if created:
-            self.cart.products.add(cart_product)
-        recalc_cart(self.cart)
+        add_cart_product(self.cart, product)
         messages.add_message(request, messages.INFO, _("Product added"))
         if get_language() == 'en':
             return HttpResponseRedirect('/cart/')
@@ -86,15 +152,12 @@ class AddToCartView(CartMixin, View):
 
 class DeleteFromCartView(CartMixin, View):
 
+    create_cart = True
+
     def get(self, request, *args, **kwargs):
         product_slug = kwargs.get('slug')
         product = Product.objects.get(slug=product_slug)
-        cart_product = CartProduct.objects.get(
-            user=self.cart.owner, cart=self.cart, product=product
-        )
-        self.cart.products.remove(cart_product)
-        cart_product.delete()
-        recalc_cart(self.cart)
+        remove_cart_product(self.cart, product)
         messages.add_message(request, messages.INFO, _("Product deleted"))
         if get_language() == 'en':
             return HttpResponseRedirect('/cart/')
@@ -104,14 +167,15 @@ class DeleteFromCartView(CartMixin, View):
 
 class ChangeQTYView(CartMixin, View):
 
+    create_cart = True
+
     def post(self, request, *args, **kwargs):
         product_slug = kwargs.get('slug')
         product = Product.objects.get(slug=product_slug)
-        cart_product = CartProduct.objects.get(user=self.cart.owner, cart=self.cart, product=product)
-        qty = int(request.POST.get('qty'))
-        cart_product.qty = qty
-        cart_product.save()
-        recalc_cart(self.cart)
+        qty = parse_cart_qty(request.POST.get('qty'))
+        if qty is None:
+            return HttpResponseBadRequest(_('Quantity must be at least 1'))
+        change_cart_product_qty(self.cart, product, qty)
         messages.add_message(request, messages.INFO, _("Quantity changed"))
         if get_language() == 'en':
             return HttpResponseRedirect('/cart/')
@@ -119,10 +183,40 @@ class ChangeQTYView(CartMixin, View):
             return HttpResponseRedirect('/lt/cart/')
 
 
+class CartBatchView(CartMixin, View):
+
+    create_cart = True
+
+    def post(self, request, *args, **kwargs):
+        try:
+            payload = json.loads(request.body)
+            items = payload['items'] if isinstance(payload, dict) else payload
+            quantities = {str(item['slug']): int(item['qty']) for item in items}
+        except (ValueError, TypeError, KeyError):
+            return JsonResponse({'error': _('Expected a list of {"slug", "qty"} items')}, status=400)
+        if any(qty < 0 for qty in quantities.values()):
+            return JsonResponse({'error': _('Quantity must not be negative')}, status=400)
+        try:
+            update_cart_products(self.cart, quantities)
+        except Product.DoesNotExist as exc:
+            return JsonResponse({'error': str(exc)}, status=404)
+        except IntegrityError:
+            return JsonResponse({'error': _('Cart was changed by another request, please retry')}, status=409)
+        items = self.cart.related_products.values('product__slug', 'qty', 'final_price')
+        return JsonResponse({
+            'total_products': self.cart.total_products,
+            'final_price': str(self.cart.final_price),
+            'items': [
+                {'slug': item['product__slug'], 'qty': item['qty'], 'final_price': str(item['final_price'])}
+                for item in items
+            ]
+        })
+
+
 class CartView(CartMixin, View):
 
     def get(self, request):
-        categories = Category.objects.all()
+        categories = get_navigation_categories()
         context = {
             'cart': self.cart,
             'categories': categories
@@ -133,45 +227,29 @@ class CartView(CartMixin, View):
 class CheckoutView(CartMixin, View):
 
     def get(self, request):
-        stripe.api_key = "sk_test_51IMdwRIpP4Nmj1V1cgpIgJwJvLhr5o36DJdqceJLrg77gSsDJODfMtLcg6Bux732fRSZJsKdb6WHFB8OAK7eMD1H00WlNCUqGm"
-
-        intent = stripe.PaymentIntent.create(
-            amount=int(self.cart.final_price * 100),
-            currency='eur',
-            metadata={'integration_check': 'accept_a_payment'},
-        )
-        categories = Category.objects.all()
+        client_secret = get_cart_payment_secret(self.cart)
+        categories = get_navigation_categories()
         form = OrderForm(request.POST or None)
         context = {
             'cart': self.cart,
             'categories': categories,
             'form': form,
-            'client_secret': intent.client_secret
+            'client_secret': client_secret
         }
         return render(request, 'checkout.html', context)
 
 
 class MakeOrderView(CartMixin, View):
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
         form = OrderForm(request.POST or None)
-        customer = Customer.objects.get(user=request.user)
         if form.is_valid():
             new_order = form.save(commit=False)
-            new_order.customer = customer
-            new_order.first_name = form.cleaned_data['first_name']
-            new_order.last_name = form.cleaned_data['last_name']
-            new_order.phone = form.cleaned_data['phone']
-            new_order.address = form.cleaned_data['address']
-            new_order.buying_type = form.cleaned_data['buying_type']
-            new_order.comment = form.cleaned_data['comment']
-            new_order.save()
-            self.cart.in_order = True
-            self.cart.save()
-            new_order.cart = self.cart
-            new_order.save()
-            customer.orders.add(new_order)
+            new_order.customer = Customer.objects.get(user=request.user)
+            order, created = place_order(self.cart, new_order)
+            if order is None:
+                messages.add_message(request, messages.INFO, _('Your cart is empty'))
+                return HttpResponseRedirect(reverse('cart'))
             messages.add_message(request, messages.INFO, _('Thank you for order, manager call you!'))
             if get_language() == 'en':
                 return HttpResponseRedirect('/en/')
@@ -186,24 +264,21 @@ class MakeOrderView(CartMixin, View):
 class LoginView(CartMixin, View):
 
     def get(self, request):
-        form = LoginForm(request.POST or None)
+        form = LoginForm(request.POST or None, request=request)
         context = {'form': form, 'cart': self.cart}
         return render(request, 'login.html', context)
 
     def post(self, request):
-        form = LoginForm(request.POST or None)
+        form = LoginForm(request.POST or None, request=request)
         if form.is_valid():
-            username = form.cleaned_data['username']
-            password = form.cleaned_data['password']
-            user = authenticate(username=username, password=password)
-            if user:
-                login(request, user)
-                if get_language() == 'en':
-                    return HttpResponseRedirect('/en/')
-                else:
-                    return HttpResponseRedirect('/lt/')
+            # The form already checked the password, authenticate() would hash it a second time.
+            login(request, form.user)
+            if get_language() == 'en':
+                return HttpResponseRedirect('/en/')
+            else:
+                return HttpResponseRedirect('/lt/')
         context = {'form': form, 'cart': self.cart}
-        return render(request, 'login.html', context)
+        return render(request, 'login.html', context, status=429 if form.throttled else 200)
 
 
 class RegistrationView(CartMixin, View):
@@ -216,21 +291,16 @@ class RegistrationView(CartMixin, View):
     def post(self, request):
         form = RegistrationForm(request.POST or None)
         if form.is_valid():
-            new_user = form.save(commit=False)
-            new_user.username = form.cleaned_data['username']
-            new_user.email = form.cleaned_data['email']
-            new_user.first_name = form.cleaned_data['first_name']
-            new_user.last_name = form.cleaned_data['last_name']
-            new_user.save()
-            new_user.set_password(form.cleaned_data['password'])
-            new_user.save()
-            Customer.objects.create(
-                user=new_user,
-                phone=form.cleaned_data['phone'],
-                address=form.cleaned_data['address']
-            )
-            user = authenticate(username=form.cleaned_data['username'], password=form.cleaned_data['password'])
-            login(request, user)
+            with transaction.atomic():
+                new_user = form.save(commit=False)
+                new_user.set_password(form.cleaned_data['password'])
+                new_user.save()
+                Customer.objects.create(
+                    user=new_user,
+                    phone=form.cleaned_data['phone'],
+                    address=form.cleaned_data['address']
+                )
+            login(request, new_user)
             if get_language() == 'en':
                 return HttpResponseRedirect('/en/')
             else:
@@ -241,34 +311,41 @@ class RegistrationView(CartMixin, View):
 
 class ProfileView(CartMixin, View):
 
+    paginate_by = 10
+
     def get(self, request):
 
         customer = Customer.objects.get(user=request.user)
-        orders = Order.objects.filter(customer=customer).order_by('-created_at')
-        categories = Category.objects.all()
-        return render(request, 'profile.html', {'orders': orders, 'cart': self.cart, 'categories': categories})
+        cursor = request.GET.get('cursor')
+        orders = Order.objects.filter(customer=customer).select_related('customer').prefetch_related('lines')
+        orders, next_cursor = keyset_paginate(
+            orders, ('-created_at', '-id'), cursor, self.paginate_by
+        )
+        categories = get_navigation_categories()
+        context = {
+            'orders': orders,
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+            'cart': self.cart,
+            'categories': categories
+        }
+        return render(request, 'profile.html', context)
 
 
 class PaidOnlineOrderView(CartMixin, View):
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
-        customer = Customer.objects.get(user=request.user)
-        new_order = Order()
-        new_order.customer = customer
-        new_order.first_name = customer.user.first_name
-        new_order.last_name = customer.user.last_name
-        new_order.phone = customer.phone
-        new_order.address = customer.address
-        new_order.buying_type = Order.BUYING_TYPE_SELF
-        new_order.save()
-        self.cart.in_order = True
-        self.cart.save()
-        new_order.status = Order.STATUS_PAID
-        new_order.cart = self.cart
-        new_order.save()
-        customer.orders.add(new_order)
-        if get_language() == 'en':
-            return HttpResponseRedirect('/en/') and JsonResponse({'status': 'paid'})
-        else:
-            return HttpResponseRedirect('/lt/') and JsonResponse({'status': 'paid'})
+        customer = Customer.objects.select_related('user').get(user=request.user)
+        new_order = Order(
+            customer=customer,
+            first_name=customer.user.first_name,
+            last_name=customer.user.last_name,
+            phone=customer.phone,
+            address=customer.address,
+            buying_type=Order.BUYING_TYPE_SELF,
+            status=Order.STATUS_PAID
+        )
+        order, created = place_order(self.cart, new_order)
+        if order is None:
+            return JsonResponse({'error': _('Your cart is empty')}, status=400)
+        return JsonResponse({'status': 'paid'})
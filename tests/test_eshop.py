@@ -1,22 +1,106 @@
+import asyncio
+import csv
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
 from decimal import Decimal
 from unittest import mock
 import pytest
-from django.contrib.auth import get_user_model
-from django.test import TestCase, RequestFactory, Client
+from django.conf import settings
+from django.contrib.auth import base_user, get_user_model, hashers
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from asgiref.sync import sync_to_async
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, RequestFactory, Client, AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import clear_url_caches, resolve
+from django.utils import timezone
+import eshop.urls
 from django.core.files.uploadedfile import SimpleUploadedFile
-from eshop.models import Product, Category, Cart, CartProduct, Customer
-from eshop.utils import recalc_cart
+from PIL import Image as PILImage
+from eshop.benchmark import (
+    FAKE_PAYMENT_GATEWAY,
+    compare_results,
+    route_names,
+    run_benchmark,
+    seed_data,
+    uncovered_routes
+)
+from eshop.checks import check_shared_cache
+from eshop.filters import CategoryProductFilter, parse_price
+from eshop.images import generate_image_variants, image_srcset
+from eshop.management.commands.startup_profile import parse_importtime, summarize_packages
+from eshop.models import Product, ProductAttribute, Category, Cart, CartProduct, Customer, Order, OrderLine
+from eshop.payments import get_payment_gateway, load_payment_gateway
+from eshop.profiling import RequestProfilingMiddleware
+from eshop.routers import CatalogReadRouter
+from eshop.search import clear_search_index, search_products
+from eshop.utils import (
+    add_cart_product,
+    build_order_lines,
+    change_cart_product_qty,
+    create_order_lines,
+    encode_cursor,
+    get_catalog_version,
+    get_navigation_categories,
+    place_order,
+    recalc_cart,
+    remove_cart_product
+)
 from eshop.views import AddToCartView, BaseView
 
 User = get_user_model()
 
 
+def create_product(category, slug='test-slug', title='something', price=500, image='notebook_image.jpg', content=b'',
+                   **fields):
+    return Product.objects.create(
+        category=category,
+        title=title,
+        slug=slug,
+        image=SimpleUploadedFile(image, content=content, content_type='image/jpg'),
+        price=price,
+        **fields
+    )
+
+
+class TemporaryMediaMixin:
+    # Uploaded product images go to a throwaway MEDIA_ROOT instead of the repository's media directory.
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class CatalogTestCase(TemporaryMediaMixin, TestCase):
+    pass
+
+
 @pytest.mark.django_db
 def test_index(client: Client):
     assert client.get('').status_code == 200
 
 
-class ProductModelTest(TestCase):
+class ProductModelTest(CatalogTestCase):
 
     def setUp(self):
         self.user = User.objects.create(username='tester', password='password')
@@ -45,6 +129,22 @@ class ProductModelTest(TestCase):
         self.assertEqual(self.cart.products.count(), 1)
         self.assertEqual(self.cart.final_price, Decimal(500.00))
 
+    def test_cart_mutations_apply_deltas(self):
+        cart = Cart.objects.create(owner=self.customer)
+        other = Product.objects.create(
+            category=self.category, title='other', slug='other-slug', image=self.image, price=Decimal('19.99')
+        )
+        add_cart_product(cart, self.product)
+        add_cart_product(cart, other)
+        change_cart_product_qty(cart, other, 3)
+        self.assertEqual(cart.final_price, Decimal('559.97'))
+        self.assertEqual(cart.total_products, 2)
+        remove_cart_product(cart, self.product)
+        self.assertEqual(cart.final_price, Decimal('59.97'))
+        self.assertEqual(cart.total_products, 1)
+        recalc_cart(cart)
+        self.assertEqual(cart.final_price, Decimal('59.97'))
+
     # def test_response_form_add_to_cart_view(self):
     #     factory = RequestFactory()
     #     request = factory.get('')
@@ -64,6 +164,997 @@ class ProductModelTest(TestCase):
             response = BaseView.as_view()(request)
             self.assertEqual(response.status_code, 444)
 
+
+class NavigationCategoriesTest(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        for index in range(3):
+            create_product(self.category, f'notebook-{index}', f'notebook {index}', 100)
+
+    def test_counts_are_cached(self):
+        with self.assertNumQueries(1):
+            categories = get_navigation_categories()
+        self.assertEqual(categories[0].product_count, 3)
+        with self.assertNumQueries(0):
+            get_navigation_categories()
+
+    def test_product_save_invalidates_cache(self):
+        get_navigation_categories()
+        Product.objects.filter(slug='notebook-0').first().delete()
+        self.assertEqual(get_navigation_categories()[0].product_count, 2)
+
+
+class AnonymousCartTest(CatalogTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='password')
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.product = create_product(self.category)
+
+    def test_each_session_gets_own_cart(self):
+        self.client.get('/en/add-to-cart/test-slug/')
+        Client().get('/en/add-to-cart/test-slug/')
+        self.assertEqual(Cart.objects.filter(for_anonymous_user=True).count(), 2)
+
+    def test_cart_reads_do_not_create_carts_or_sessions(self):
+        for url in ('/en/cart/', '/en/checkout/') * 5:
+            response = Client().get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_cart_merged_on_login(self):
+        self.client.get('/en/add-to-cart/test-slug/')
+        self.client.post('/en/login/', {'username': 'tester', 'password': 'password'})
+        cart = Cart.objects.get(owner__user=self.user, in_order=False)
+        self.assertEqual(cart.total_products, 1)
+        self.assertEqual(cart.final_price, Decimal(500))
+        self.assertFalse(Cart.objects.filter(for_anonymous_user=True).exists())
+
+
+class ViewQueryCountTest(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.product = create_product(self.category)
+        get_navigation_categories()
+
+    def test_views_without_cart_do_not_query_it(self):
+        expected = {
+            '/en/login/': 0,
+            '/en/registration/': 0,
+            '/en/': 1,
+            '/en/products/test-slug/': 1,
+            '/en/category/notebooks/': 4,
+        }
+        for url, num_queries in expected.items():
+            with self.subTest(url=url), self.assertNumQueries(num_queries):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse(Cart.objects.exists())
+
+
+class CartBatchViewTest(CatalogTestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        for index in range(5):
+            create_product(self.category, f'notebook-{index}', f'notebook {index}', 10 * (index + 1))
+
+    def post_items(self, items):
+        return self.client.post('/en/cart/batch/', json.dumps({'items': items}), content_type='application/json')
+
+    def test_batch_add_update_remove(self):
+        response = self.post_items([{'slug': f'notebook-{index}', 'qty': 2} for index in range(5)])
+        self.assertEqual(response.json()['total_products'], 5)
+        self.assertEqual(response.json()['final_price'], '300.00')
+        response = self.post_items([{'slug': 'notebook-0', 'qty': 0}, {'slug': 'notebook-1', 'qty': 1}])
+        self.assertEqual(response.json()['total_products'], 4)
+        self.assertEqual(response.json()['final_price'], '260.00')
+        cart = Cart.objects.get()
+        self.assertEqual(cart.products.count(), 4)
+        recalc_cart(cart)
+        self.assertEqual(cart.final_price, Decimal('260.00'))
+
+    def test_unknown_slug_changes_nothing(self):
+        response = self.post_items([{'slug': 'notebook-0', 'qty': 1}, {'slug': 'missing', 'qty': 1}])
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartProduct.objects.exists())
+
+
+@override_settings(PAYMENT_GATEWAY='eshop.payments.FakeGateway')
+class CheckoutPaymentIntentTest(CatalogTestCase):
+
+    def setUp(self):
+        load_payment_gateway.cache_clear()
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        for index in range(2):
+            create_product(self.category, f'notebook-{index}', f'notebook {index}', 100)
+        user = User.objects.create_user(username='tester', password='password')
+        self.client.force_login(user)
+        self.client.get('/en/add-to-cart/notebook-0/')
+
+    def test_intent_reused_until_amount_changes(self):
+        first_secret = self.client.get('/en/checkout/').context['client_secret']
+        self.assertEqual(self.client.get('/en/checkout/').context['client_secret'], first_secret)
+        self.client.get('/en/add-to-cart/notebook-1/')
+        self.assertEqual(self.client.get('/en/checkout/').context['client_secret'], first_secret)
+        cart = Cart.objects.get()
+        self.assertEqual(cart.payment_intent_amount, 20000)
+        intent = get_payment_gateway().intents[cart.payment_intent_id]
+        self.assertEqual(intent.amount, 20000)
+        self.assertEqual(len(get_payment_gateway().intents), 1)
+
+
+@override_settings(ASYNC_VIEWS=True, PAYMENT_GATEWAY='eshop.payments.FakeGateway')
+class AsyncViewsTest(CatalogTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        importlib.reload(eshop.urls)
+        clear_url_caches()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        importlib.reload(eshop.urls)
+        clear_url_caches()
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.product = create_product(self.category)
+        self.user = User.objects.create_user(username='tester', password='password')
+
+    async def test_catalog_and_cart_flow(self):
+        self.assertTrue(asyncio.iscoroutinefunction(resolve('/en/').func))
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.user)
+        for url in ('/en/', '/en/products/test-slug/', '/en/category/notebooks/'):
+            response = await client.get(url)
+            self.assertEqual(response.status_code, 200)
+        response = await client.get('/en/add-to-cart/test-slug/')
+        self.assertEqual(response.status_code, 302)
+        response = await client.post(
+            '/en/change-qty/test-slug/', 'qty=2', content_type='application/x-www-form-urlencoded'
+        )
+        self.assertEqual(response.status_code, 302)
+        response = await client.get('/en/cart/')
+        self.assertEqual(response.context['cart'].final_price, Decimal(1000))
+        response = await client.get('/en/checkout/')
+        self.assertTrue(response.context['client_secret'])
+
+    async def test_detail_views_answer_conditional_requests(self):
+        client = AsyncClient()
+        for url in ('/en/products/test-slug/', '/en/category/notebooks/'):
+            with self.subTest(url=url):
+                response = await client.get(url)
+                self.assertTrue(response.has_header('Last-Modified'))
+                # The 3.1 AsyncClient turns extra keyword arguments into header names as given.
+                response = await client.get(url, **{'If-None-Match': response['ETag']})
+                self.assertEqual(response.status_code, 304)
+
+    async def test_templates_render_off_the_event_loop(self):
+        loops = []
+
+        def get_catalog_version():
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return 1
+
+        client = AsyncClient()
+        urls = ('/en/', '/en/products/test-slug/', '/en/category/notebooks/', '/en/cart/', '/en/checkout/')
+        with mock.patch('eshop.context_processors.get_catalog_version', get_catalog_version):
+            for url in urls:
+                self.assertEqual((await client.get(url)).status_code, 200)
+        self.assertEqual(loops, [None] * len(urls))
+
+
+class ProfileOrderHistoryTest(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='password')
+        self.customer = Customer.objects.create(user=self.user, phone='222222211', address='Address')
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.products = [
+            create_product(self.category, f'notebook-{index}', f'notebook {index}', 100)
+            for index in range(3)
+        ]
+        self.client.force_login(self.user)
+        get_navigation_categories()
+
+    def create_orders(self, count):
+        for index in range(count):
+            cart = Cart.objects.create(owner=self.customer, in_order=True)
+            for product in self.products:
+                add_cart_product(cart, product)
+            order = Order.objects.create(
+                customer=self.customer, first_name='A', last_name='B', phone='1', address='C', cart=cart
+            )
+            create_order_lines(order, build_order_lines(cart))
+
+    def test_query_count_does_not_depend_on_orders(self):
+        self.create_orders(2)
+        with self.assertNumQueries(4):
+            self.client.get('/en/profile/')
+        self.create_orders(8)
+        with self.assertNumQueries(4):
+            response = self.client.get('/en/profile/')
+        self.assertEqual(len(response.context['orders']), 10)
+
+    def test_keyset_pages_cover_all_orders(self):
+        self.create_orders(13)
+        response = self.client.get('/en/profile/')
+        first_page = response.context['orders']
+        response = self.client.get('/en/profile/', {'cursor': response.context['next_cursor']})
+        self.assertEqual(len(first_page), 10)
+        self.assertEqual(len(response.context['orders']), 3)
+        self.assertIsNone(response.context['next_cursor'])
+        seen = {order.pk for order in first_page} | {order.pk for order in response.context['orders']}
+        self.assertEqual(seen, set(Order.objects.values_list('pk', flat=True)))
+
+    def test_order_keeps_snapshot_of_lines(self):
+        cart = Cart.objects.get_or_create(owner=self.customer, in_order=False)[0]
+        add_cart_product(cart, self.products[0])
+        change_cart_product_qty(cart, self.products[0], 2)
+        self.client.post('/en/make-order/', {
+            'first_name': 'A', 'last_name': 'B', 'phone': '1', 'address': 'C', 'buying_type': 'self'
+        })
+        Product.objects.filter(pk=self.products[0].pk).update(title='renamed', price=1)
+        cart.delete()
+        order = Order.objects.get()
+        self.assertEqual(order.final_price, Decimal(200))
+        line = order.lines.get()
+        self.assertEqual((line.title, line.unit_price, line.qty), ('notebook 0', Decimal(100), 2))
+
+
+class ProductSearchTest(CatalogTestCase):
+
+    def setUp(self):
+        self.notebooks = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.phones = Category.objects.create(name='Phones', slug='phones')
+        for slug, title, category, description in (
+            ('lenovo-thinkpad', 'Lenovo ThinkPad', self.notebooks, 'Business notebook'),
+            ('apple-macbook', 'Apple MacBook', self.notebooks, 'Thin and light'),
+            ('apple-iphone', 'Apple iPhone', self.phones, 'Phone by Apple'),
+        ):
+            create_product(category, slug, title, 100, description=description)
+
+    def search(self, query, page=1):
+        products, has_next = search_products(query, page, 24)
+        return [product.slug for product in products]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.search('thinkp'), ['lenovo-thinkpad'])
+        self.assertEqual(self.search('apple'), ['apple-iphone', 'apple-macbook'])
+        self.assertEqual(self.search('apple phon'), ['apple-iphone'])
+        self.assertEqual(set(self.search('notebooks')), {'lenovo-thinkpad', 'apple-macbook'})
+
+    def test_index_follows_product_and_category_changes(self):
+        Product.objects.get(slug='lenovo-thinkpad').delete()
+        self.assertEqual(self.search('thinkpad'), [])
+        self.phones.name = 'Smartphones'
+        self.phones.save()
+        self.assertEqual(self.search('smartphones'), ['apple-iphone'])
+
+    def test_rebuild_command(self):
+        clear_search_index()
+        self.assertEqual(self.search('apple'), [])
+        call_command('rebuild_search_index', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(len(self.search('apple')), 2)
+
+    def test_search_view_paginates(self):
+        with mock.patch('eshop.views.SearchView.paginate_by', 1):
+            response = self.client.get('/en/search/', {'q': 'apple'})
+        self.assertEqual(len(response.context['products']), 1)
+        self.assertTrue(response.context['has_next'])
+
+
+class CategoryFacetTest(CatalogTestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        for index, (price, color, ram) in enumerate((
+            (40, 'black', '8GB'), (80, 'black', '16GB'), (120, 'silver', '16GB'), (700, 'silver', '32GB'),
+        )):
+            product = create_product(self.category, f'notebook-{index}', f'notebook {index}', price)
+            ProductAttribute.objects.create(product=product, name='color', value=color)
+            ProductAttribute.objects.create(product=product, name='ram', value=ram)
+
+    def test_filters_and_facet_counts(self):
+        product_filter = CategoryProductFilter(self.category, {'color': 'silver', 'price_min': '100'})
+        products, next_cursor = product_filter.get_page()
+        self.assertEqual({product.slug for product in products}, {'notebook-2', 'notebook-3'})
+        with self.assertNumQueries(3):
+            facets = product_filter.get_facets()
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [0, 0, 1, 1, 0])
+        attributes = dict(facets['attributes'])
+        self.assertEqual([(item['value'], item['count']) for item in attributes['color']], [('silver', 2)])
+        self.assertEqual([(item['value'], item['count']) for item in attributes['ram']], [('16GB', 1), ('32GB', 1)])
+
+    def test_non_finite_prices_are_ignored(self):
+        for value in ('sNaN', 'NaN', 'Infinity', '-inf'):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_price(value))
+                response = self.client.get('/en/category/notebooks/', {'price_min': value, 'price_max': value})
+                self.assertEqual(response.status_code, 200)
+
+    def test_sorted_cursor_pages(self):
+        with mock.patch.object(CategoryProductFilter, 'page_size', 3):
+            response = self.client.get('/en/category/notebooks/', {'sort': '-price'})
+            product_filter = response.context['product_filter']
+            first_page = [product.slug for product in product_filter.page.object_list]
+            response = self.client.get('/en/category/notebooks/' + product_filter.next_page_url)
+        product_filter = response.context['product_filter']
+        self.assertEqual(first_page, ['notebook-3', 'notebook-2', 'notebook-1'])
+        self.assertEqual([product.slug for product in product_filter.page.object_list], ['notebook-0'])
+        self.assertIsNone(product_filter.next_page_url)
+
+
+class HomeProductListTest(CatalogTestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        for index in range(5):
+            create_product(self.category, f'notebook-{index}', f'notebook {index}', 100)
+
+    @mock.patch('eshop.views.BaseView.paginate_by', 2)
+    def test_home_page_and_load_more(self):
+        response = self.client.get('/en/')
+        self.assertEqual([product.slug for product in response.context['page'].object_list], ['notebook-4', 'notebook-3'])
+        self.assertNotContains(response, 'innerHTML')
+        self.assertContains(response, 'data-login-hint=')
+        slugs = []
+        cursor = response.context['page'].next_cursor
+        while cursor:
+            data = self.client.get('/en/api/products/', {'cursor': cursor}).json()
+            self.assertEqual(
+                {key: data['products'][0][key] for key in ('srcset', 'webp_srcset', 'add_to_cart_url')},
+                {'srcset': '', 'webp_srcset': '', 'add_to_cart_url': f"/en/add-to-cart/{data['products'][0]['slug']}/"}
+            )
+            slugs += [product['slug'] for product in data['products']]
+            cursor = data['next_cursor']
+        self.assertEqual(slugs, ['notebook-2', 'notebook-1', 'notebook-0'])
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        for values in (['x'], [None], [[1]], ['2021-13-45T99:00:00']):
+            cursor = encode_cursor(values)
+            with self.subTest(values=values):
+                self.assertEqual(self.client.get('/en/', {'cursor': cursor}).status_code, 200)
+                self.assertEqual(len(self.client.get('/en/api/products/', {'cursor': cursor}).json()['products']), 5)
+        response = self.client.get('/en/category/notebooks/', {'sort': 'price', 'cursor': encode_cursor(['x', 'y'])})
+        self.assertEqual(response.status_code, 200)
+        customer = Customer.objects.create(user=User.objects.create_user(username='buyer'))
+        self.client.force_login(customer.user)
+        self.assertEqual(self.client.get('/en/profile/', {'cursor': encode_cursor(['yesterday', 1])}).status_code, 200)
+
+
+class ImageVariantsTest(CatalogTestCase):
+
+    def setUp(self):
+        settings_override = override_settings(IMAGE_VARIANT_WIDTHS=(200, 400, 2000))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (1000, 500), 'red').save(buffer, 'JPEG')
+        self.product = create_product(
+            Category.objects.create(name='Notebooks', slug='notebooks'), image='notebook.jpg', content=buffer.getvalue()
+        )
+
+    def test_variants_generated_next_to_original(self):
+        version = get_catalog_version()
+        updated_at = Product.objects.get(pk=self.product.pk).updated_at
+        generate_image_variants(self.product.pk)
+        self.product.refresh_from_db()
+        self.assertEqual(get_catalog_version(), version + 1)
+        self.assertGreater(self.product.updated_at, updated_at)
+        self.assertEqual(self.product.image_variants, {'source': 'notebook.jpg', 'widths': [200, 400]})
+        for name in ('notebook_w200.jpg', 'notebook_w200.webp', 'notebook_w400.jpg', 'notebook_w400.webp'):
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+        with PILImage.open(os.path.join(self.media_root, 'notebook_w200.webp')) as variant:
+            self.assertEqual(variant.size, (200, 100))
+        self.assertEqual(image_srcset(self.product, '.webp'), '/media/notebook_w200.webp 200w, /media/notebook_w400.webp 400w')
+        self.assertIn('srcset="/media/notebook_w200.jpg 200w', self.client.get('/en/products/test-slug/').content.decode())
+
+
+class CatalogFragmentCacheTest(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.product = create_product(self.category)
+
+    def test_fragments_follow_catalog_version(self):
+        self.assertContains(self.client.get('/en/products/test-slug/'), 'something')
+        Product.objects.filter(pk=self.product.pk).update(description='changed silently')
+        self.assertNotContains(self.client.get('/en/products/test-slug/'), 'changed silently')
+        self.product.description = 'changed with save'
+        self.product.save()
+        self.assertContains(self.client.get('/en/products/test-slug/'), 'changed with save')
+
+    def test_attribute_edit_invalidates_etag_and_facets(self):
+        attribute = ProductAttribute.objects.create(product=self.product, name='color', value='black')
+        response = self.client.get('/en/category/notebooks/')
+        self.assertContains(response, 'black (1)')
+        attribute.value = 'silver'
+        attribute.save()
+        response = self.client.get('/en/category/notebooks/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'silver (1)')
+        self.assertNotContains(response, 'black (1)')
+        etag = self.client.get('/en/products/test-slug/')['ETag']
+        attribute.delete()
+        self.assertEqual(self.client.get('/en/products/test-slug/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_fragment_hits_skip_catalog_queries(self):
+        ProductAttribute.objects.create(product=self.product, name='color', value='black')
+        self.client.get('/en/')
+        self.client.get('/en/category/notebooks/', {'color': 'black', 'price_min': '100'})
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get('/en/', {'cursor': 'unknown'}), 'something')
+        # Only the category lookup behind the conditional GET validators is left.
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/en/category/notebooks/', {'price_min': '100.0', 'color': ['black', 'black'], 'utm_source': 'mail'}
+            )
+        self.assertContains(response, 'black (1)')
+        self.assertNotContains(response, 'utm_source')
+
+    def test_cart_badge_is_not_cached(self):
+        self.client.get('/en/products/test-slug/')
+        self.client.get('/en/add-to-cart/test-slug/')
+        response = self.client.get('/en/products/test-slug/')
+        self.assertContains(response, '<span class="badge badge-pill badge-danger">1</span>')
+
+
+class ConditionalGetTest(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.product = create_product(self.category)
+
+    def test_unchanged_product_returns_not_modified(self):
+        for url in ('/en/products/test-slug/', '/en/category/notebooks/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.has_header('Last-Modified'))
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_changed_product_or_cart_invalidates_etag(self):
+        etag = self.client.get('/en/products/test-slug/')['ETag']
+        self.product.title = 'changed'
+        self.product.save()
+        response = self.client.get('/en/products/test-slug/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.client.get('/en/add-to-cart/test-slug/')
+        self.client.get('/en/cart/')
+        response = self.client.get('/en/products/test-slug/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class CartOrderIndexTest(CatalogTestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret')
+        self.customer = Customer.objects.create(user=self.user, phone='123', address='Street 1')
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.product = create_product(self.category)
+        self.cart = Cart.objects.create(owner=self.customer)
+
+    def test_hot_lookups_use_indexes(self):
+        plans = [
+            (Cart.objects.filter(owner=self.customer, in_order=False), '(owner_id=?'),
+            (CartProduct.objects.filter(cart=self.cart, product=self.product), '(cart_id=? AND product_id=?'),
+            (Order.objects.filter(customer=self.customer).order_by('-created_at'), '(customer_id=?'),
+        ]
+        for queryset, columns in plans:
+            with self.subTest(model=queryset.model.__name__):
+                plan = queryset.explain()
+                self.assertRegex(plan, r'SEARCH .*USING (COVERING )?INDEX \w+ ' + re.escape(columns))
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_duplicate_cart_line_is_rejected(self):
+        add_cart_product(self.cart, self.product)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartProduct.objects.create(user=self.customer, cart=self.cart, product=self.product, qty=1)
+        self.assertEqual(add_cart_product(self.cart, self.product).qty, 1)
+        self.assertEqual(self.cart.related_products.count(), 1)
+        self.assertEqual(self.cart.total_products, 1)
+
+
+@override_settings(PAYMENT_GATEWAY=FAKE_PAYMENT_GATEWAY, IMAGE_VARIANTS_ASYNC=False)
+class BenchmarkTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_route_has_a_working_scenario(self):
+        self.assertEqual(uncovered_routes(), [])
+        data = seed_data(categories=2, products=10, customers=2, carts=3, orders=4)
+        results = run_benchmark(data, iterations=1, warmup=0)
+        self.assertEqual(sorted(results['routes']), sorted(route_names()))
+        for name, result in results['routes'].items():
+            with self.subTest(route=name):
+                self.assertFalse([status for status in result['statuses'] if status.startswith(('4', '5'))])
+
+    def test_compare_flags_slower_routes_and_extra_queries(self):
+        baseline = {'routes': {'base': {'p50_ms': 10.0, 'p95_ms': 12.0, 'queries_max': 1}}}
+        current = {'routes': {'base': {'p50_ms': 10.5, 'p95_ms': 20.0, 'queries_max': 2}}}
+        self.assertEqual(compare_results(baseline, current), [
+            ('base', 'p95_ms', 12.0, 20.0),
+            ('base', 'queries_max', 1, 2),
+        ])
+
+
+class RequestProfilingTest(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.product = create_product(self.category)
+
+    def test_disabled_by_default(self):
+        response = self.client.get('/en/products/test-slug/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_SLOW_MS=0, REQUEST_PROFILING_REPEATED_QUERIES=2)
+    def test_server_timing_and_slow_request_log(self):
+        with self.assertLogs('eshop.profiling', 'WARNING') as logs:
+            response = self.client.get('/en/products/test-slug/')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", template;dur=')
+        record = next(record.profile for record in logs.records if hasattr(record, 'profile'))
+        self.assertEqual(record['view'], 'product_detail')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_REPEATED_QUERIES=3)
+    def test_repeated_queries_are_reported_with_view(self):
+        def n_plus_one_view(request):
+            for product in Product.objects.all():
+                Category.objects.get(pk=product.category_id)
+            return HttpResponse()
+
+        for index in range(3):
+            create_product(self.category, f'other-{index}', f'other {index}', 10)
+        request = RequestFactory().get('/en/')
+        request.resolver_match = resolve('/en/')
+        with self.assertLogs('eshop.profiling', 'WARNING') as logs:
+            response = RequestProfilingMiddleware(n_plus_one_view)(request)
+        self.assertIn('desc="5 queries"', response['Server-Timing'])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Repeated query in base (4 times)', logs.output[0])
+
+
+class ImportCatalogTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        Category.objects.create(name='Notebooks', slug='notebooks')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as catalog:
+            catalog.write(content)
+        return path
+
+    def test_csv_then_jsonl_upsert(self):
+        path = self.write('catalog.csv', (
+            'slug,title,category,category_name,price,description,image\n'
+            'lenovo-x1,Lenovo X1,notebooks,,1499.90,Light notebook,products/x1.jpg\n'
+            'pixel-7,Pixel 7,phones,Phones,599,,products/pixel.jpg\n'
+            'broken,Broken,phones,,not a price,,\n'
+        ))
+        version = get_catalog_version()
+        call_command('import_catalog', path, batch_size=2, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Product.objects.get(slug='pixel-7').category.name, 'Phones')
+        self.assertEqual(Product.objects.get(slug='lenovo-x1').image.name, 'products/x1.jpg')
+        self.assertFalse(Product.objects.filter(slug='broken').exists())
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertEqual([product.slug for product in search_products('lenovo')[0]], ['lenovo-x1'])
+
+        updated_at = Product.objects.get(slug='pixel-7').updated_at
+        path = self.write('catalog.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'slug': 'lenovo-x1', 'title': 'Lenovo X1', 'category': 'notebooks', 'price': '1499.90',
+             'description': 'Light notebook', 'image': 'products/x1.jpg'},
+            {'slug': 'pixel-7', 'title': 'Pixel 7a', 'category': 'phones', 'price': 499, 'image': 'products/pixel.jpg'},
+        ]))
+        stdout = io.StringIO()
+        call_command('import_catalog', path, stdout=stdout, stderr=io.StringIO())
+        self.assertIn('0 created, 1 updated, 1 unchanged, 0 skipped', stdout.getvalue())
+        pixel = Product.objects.get(slug='pixel-7')
+        self.assertEqual((pixel.title, pixel.price), ('Pixel 7a', Decimal('499.00')))
+        self.assertGreater(pixel.updated_at, updated_at)
+        self.assertEqual(Category.objects.count(), 2)
+
+    def test_invalid_rows_are_skipped(self):
+        path = self.write('catalog.csv', (
+            'slug,title,category,price\n'
+            'huge-price,Huge,notebooks,1e12\n'
+            'negative,Negative,notebooks,-1\n'
+            'bad slug,Bad slug,notebooks,10\n'
+            'long-title,' + 'x' * 256 + ',notebooks,10\n'
+            'bad-category,Bad category,bad category,10\n'
+            'valid,Valid,notebooks,10\n'
+        ))
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        call_command('import_catalog', path, stdout=stdout, stderr=stderr)
+        self.assertIn('1 created, 0 updated, 0 unchanged, 5 skipped', stdout.getvalue())
+        self.assertEqual(list(Product.objects.values_list('slug', flat=True)), ['valid'])
+        self.assertEqual(len(re.findall(r'Row \d+: skipped', stderr.getvalue())), 5)
+
+
+class RepairCartsTest(CatalogTestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.carts = [Cart.objects.create() for _ in range(3)]
+        for index, cart in enumerate(self.carts):
+            add_cart_product(cart, create_product(category, f'notebook-{index}', f'notebook {index}', 100))
+
+    def test_totals_are_repaired_from_the_cart_lines(self):
+        # The line is still linked through CartProduct.cart but lost its many-to-many row.
+        Cart.products.through.objects.filter(cart=self.carts[0]).delete()
+        Cart.objects.filter(pk__in=[cart.pk for cart in self.carts[:2]]).update(final_price=0, total_products=0)
+        stdout = io.StringIO()
+        call_command('repair_carts', dry_run=True, stdout=stdout)
+        self.assertIn('Repaired 0 carts', stdout.getvalue())
+        self.assertEqual(Cart.objects.filter(final_price=0).count(), 2)
+        with mock.patch('eshop.management.commands.repair_carts.REPAIR_CHUNK_SIZE', 1):
+            call_command('repair_carts', stdout=stdout)
+        self.assertIn('Repaired 2 carts', stdout.getvalue())
+        self.assertEqual(
+            list(Cart.objects.order_by('pk').values_list('final_price', 'total_products')), [(Decimal(100), 1)] * 3
+        )
+
+
+class OrderExportTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_superuser('finance', 'finance@example.com', 'secret')
+        self.customer = Customer.objects.create(user=user, phone='123', address='Street 1')
+        self.orders = []
+        for index, status in enumerate([Order.STATUS_NEW, Order.STATUS_PAID, Order.STATUS_PAID]):
+            order = Order.objects.create(
+                customer=self.customer, first_name='Ann', last_name='Lee', phone='123', address='Street 1',
+                status=status, total_products=2, final_price=Decimal('30.00')
+            )
+            OrderLine.objects.create(order=order, title=f'Item {index}', unit_price=10, qty=1, final_price=10)
+            OrderLine.objects.create(order=order, title=f'Other {index}', unit_price=20, qty=1, final_price=20)
+            self.orders.append(order)
+
+    def test_command_streams_filtered_orders_in_chunks(self):
+        stdout = io.StringIO()
+        with self.assertNumQueries(5):
+            call_command('export_orders', status=['paid'], chunk_size=1, stdout=stdout)
+        rows = list(csv.DictReader(io.StringIO(stdout.getvalue())))
+        expected = [str(self.orders[1].pk)] * 2 + [str(self.orders[2].pk)] * 2
+        self.assertEqual([row['order_id'] for row in rows], expected)
+        self.assertEqual(rows[0]['line_title'], 'Item 1')
+
+        stdout = io.StringIO()
+        call_command('export_orders', format='jsonl', date_from=timezone.localdate(), stdout=stdout)
+        orders = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(len(orders), 3)
+        self.assertEqual([line['title'] for line in orders[0]['lines']], ['Item 0', 'Other 0'])
+
+    def test_admin_action_streams_response(self):
+        self.client.force_login(self.customer.user)
+        response = self.client.post('/en/admin/eshop/order/', {
+            'action': 'export_jsonl',
+            '_selected_action': [self.orders[0].pk, self.orders[2].pk],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.jsonl"')
+        orders = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([order['id'] for order in orders], [self.orders[0].pk, self.orders[2].pk])
+
+
+class SessionStorageTest(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Notebooks', slug='notebooks')
+        self.product = create_product(self.category)
+
+    @override_settings(SESSION_CACHE_ALIAS='default', SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_cart_mutation_does_not_touch_session_table(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/en/add-to-cart/test-slug/')
+            self.client.get('/en/cart/')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([query for query in context.captured_queries if 'django_session' in query['sql']])
+        self.assertIn('messages', response.cookies)
+
+    def test_default_sessions_are_signed_cookies(self):
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.signed_cookies')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/en/add-to-cart/test-slug/')
+        self.assertFalse([query for query in context.captured_queries if 'django_session' in query['sql']])
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.client.get('/en/cart/').context['cart'].total_products, 1)
+        self.assertEqual(Cart.objects.count(), 1)
+
+    def test_signed_cookie_sessions_keep_separate_anonymous_carts(self):
+        other = Client()
+        self.client.get('/en/add-to-cart/test-slug/')
+        other.get('/en/add-to-cart/test-slug/')
+        other.get('/en/remove-from-cart/test-slug/')
+        self.assertEqual(Cart.objects.filter(for_anonymous_user=True).count(), 2)
+        self.assertEqual(self.client.get('/en/cart/').context['cart'].total_products, 1)
+        self.assertEqual(other.get('/en/cart/').context['cart'].total_products, 0)
+
+    def test_clear_legacy_sessions_deletes_expired_rows(self):
+        now = timezone.now()
+        Session.objects.create(session_key='expired', session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='active', session_data='', expire_date=now + timedelta(days=1))
+        call_command('clear_legacy_sessions', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['active'])
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+
+    def test_deploy_check_warns_about_process_local_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['eshop.W001'])
+        memcached = {'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache'}}
+        with override_settings(CACHES=memcached):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class SQLiteProfileTest(TransactionTestCase):
+
+    def test_router_sends_catalog_reads_to_read_only_connection(self):
+        router = CatalogReadRouter()
+        self.assertEqual(router.db_for_read(Product), 'catalog')
+        self.assertIsNone(router.db_for_read(Cart))
+        self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertFalse(router.allow_migrate('catalog', 'eshop'))
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+    def run_on_production_databases(self, *targets):
+        # Worker threads open their own connections, so they pick up the temporary file databases below.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'shop.sqlite3')
+        engine = settings.DATABASES['default']['ENGINE']
+        databases = {
+            'default': {'ENGINE': engine, 'NAME': path, 'OPTIONS': {'timeout': 20}},
+            'catalog': {'ENGINE': engine, 'NAME': f'file:{path}?mode=ro', 'OPTIONS': {'timeout': 20}},
+        }
+        errors = []
+
+        def run(target):
+            try:
+                target()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        with mock.patch.dict(connections.databases, databases):
+            for group in targets:
+                threads = [threading.Thread(target=run, args=(target,)) for target in group]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        return errors
+
+    @override_settings(
+        SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+        DATABASE_ROUTERS=['eshop.routers.CatalogReadRouter']
+    )
+    def test_concurrent_cart_writers_and_catalog_readers(self):
+        results = {}
+
+        def setup():
+            call_command('migrate', run_syncdb=True, interactive=False, verbosity=0)
+            category = Category.objects.create(name='Notebooks', slug='notebooks')
+            products = [
+                Product.objects.create(category=category, title=f'Notebook {number}', slug=f'notebook-{number}', price=10)
+                for number in range(5)
+            ]
+            results['carts'] = [Cart.objects.create().pk for _ in range(8)]
+            results['products'] = [product.pk for product in products]
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                results['journal_mode'] = cursor.fetchone()[0]
+
+        def write(index):
+            cart = Cart.objects.get(pk=results['carts'][index])
+            for product in Product.objects.filter(pk__in=results['products']):
+                add_cart_product(cart, product)
+                change_cart_product_qty(cart, product, 3)
+
+        def read():
+            for _ in range(20):
+                products = Product.objects.all()
+                self.assertEqual(products.db, 'catalog')
+                self.assertEqual(len(products), 5)
+
+        def check():
+            results['totals'] = list(Cart.objects.values_list('total_products', 'final_price'))
+
+        errors = self.run_on_production_databases(
+            [setup], [lambda index=index: write(index) for index in range(8)] + [read] * 4, [check]
+        )
+        self.assertEqual(errors, [])
+        self.assertEqual(results['journal_mode'], 'wal')
+        self.assertEqual(results['totals'], [(5, Decimal('150.00'))] * 8)
+
+
+class PlaceOrderTest(TemporaryMediaMixin, TransactionTestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='buyer', password='secret', first_name='Ann', last_name='Lee')
+        self.customer = Customer.objects.create(user=user, phone='123', address='Street 1')
+        category = Category.objects.create(name='Notebooks', slug='notebooks')
+        product = create_product(category)
+        self.cart = Cart.objects.create(owner=self.customer)
+        add_cart_product(self.cart, product)
+
+    def new_order(self):
+        return Order(customer=self.customer, first_name='Ann', last_name='Lee', phone='123', address='Street 1')
+
+    def test_duplicate_submission_returns_the_first_order(self):
+        order, created = place_order(self.cart, self.new_order())
+        self.assertTrue(created)
+        self.assertEqual((order.total_products, order.final_price), (1, Decimal('500.00')))
+        stale_cart = Cart.objects.get(pk=self.cart.pk)
+        stale_cart.in_order = False
+        duplicate, created = place_order(stale_cart, self.new_order())
+        self.assertFalse(created)
+        self.assertEqual(duplicate.pk, order.pk)
+        self.assertEqual(OrderLine.objects.filter(order=order).count(), 1)
+
+    def test_parallel_duplicate_submissions_create_one_order(self):
+        barrier = threading.Barrier(4)
+        results = []
+        errors = []
+
+        def submit():
+            try:
+                barrier.wait()
+                for attempt in range(50):
+                    try:
+                        results.append(place_order(Cart.objects.get(pk=self.cart.pk), self.new_order()))
+                        return
+                    except OperationalError:
+                        # The shared in-memory test database reports lock conflicts instead of waiting.
+                        time.sleep(0.01)
+                errors.append('gave up')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(created for order, created in results), [False, False, False, True])
+        self.assertEqual({order.pk for order, created in results}, set(Order.objects.values_list('pk', flat=True)))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderLine.objects.count(), 1)
+        self.assertTrue(Cart.objects.get(pk=self.cart.pk).in_order)
+
+    def test_views_place_one_order_per_cart(self):
+        self.client.force_login(self.customer.user)
+        data = {'first_name': 'Ann', 'last_name': 'Lee', 'phone': '123', 'address': 'Street 1',
+                'buying_type': Order.BUYING_TYPE_SELF, 'comment': ''}
+        self.client.post('/en/make-order/', data)
+        self.assertNotIn('cart_total_products', self.client.session)
+        response = self.client.post('/en/make-order/', data)
+        self.assertRedirects(response, '/en/cart/')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.client.post('/en/paid-online-order/').status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+    def test_zero_quantity_is_rejected_and_cannot_break_checkout(self):
+        self.client.force_login(self.customer.user)
+        for qty in ('0', '-1', 'x'):
+            self.assertEqual(self.client.post('/en/change-qty/test-slug/', {'qty': qty}).status_code, 400)
+        self.assertEqual(CartProduct.objects.get(cart=self.cart).qty, 1)
+        CartProduct.objects.filter(cart=self.cart).update(qty=0)
+        order, created = place_order(self.cart, self.new_order())
+        self.assertTrue(created)
+        self.assertEqual(OrderLine.objects.get(order=order).unit_price, Decimal('500.00'))
+
+    def test_order_prices_come_from_the_cart_lines(self):
+        change_cart_product_qty(self.cart, Product.objects.get(), 3)
+        Product.objects.update(price=Decimal('99.99'))
+        order, created = place_order(self.cart, self.new_order())
+        line = OrderLine.objects.get(order=order)
+        self.assertEqual((line.unit_price, line.qty, line.final_price), (Decimal('500.00'), 3, Decimal('1500.00')))
+        self.assertEqual((order.total_products, order.final_price), (1, Decimal('1500.00')))
+
+
+class AuthenticationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='password')
+
+    def test_login_hashes_password_once(self):
+        with mock.patch.object(base_user, 'check_password', wraps=hashers.check_password) as check:
+            response = self.client.post('/en/login/', {'username': 'tester', 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(check.call_count, 1)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+
+    def test_registration_hashes_password_once(self):
+        data = {'username': 'newbie', 'password': 'secret', 'confirm_password': 'secret', 'first_name': 'Ann',
+                'last_name': 'Lee', 'address': 'Street 1', 'phone': '123', 'email': 'ann@example.com'}
+        with mock.patch.object(base_user, 'make_password', wraps=hashers.make_password) as make:
+            with mock.patch.object(base_user, 'check_password', wraps=hashers.check_password) as check:
+                response = self.client.post('/en/registration/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual((make.call_count, check.call_count), (1, 0))
+        user = User.objects.get(username='newbie')
+        self.assertTrue(user.check_password('secret'))
+        self.assertTrue(Customer.objects.filter(user=user, phone='123').exists())
+        response = Client().post('/en/registration/', dict(data, username='other'))
+        self.assertIn('email', response.context['form'].errors)
+
+    @override_settings(LOGIN_ATTEMPT_LIMIT=2)
+    def test_throttled_login_skips_hashing(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post('/en/login/', {'username': 'tester', 'password': 'wrong'}).status_code, 200)
+        with mock.patch.object(base_user, 'check_password', wraps=hashers.check_password) as check:
+            response = self.client.post('/en/login/', {'username': 'tester', 'password': 'password'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(check.call_count, 0)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    @override_settings(LOGIN_ATTEMPT_LIMIT=2)
+    def test_successful_login_resets_username_attempts(self):
+        self.client.post('/en/login/', {'username': 'tester', 'password': 'wrong'})
+        self.client.post('/en/login/', {'username': 'tester', 'password': 'password'})
+        self.client.logout()
+        self.client.post('/en/login/', {'username': 'tester', 'password': 'wrong'})
+        response = self.client.post('/en/login/', {'username': 'tester', 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+
+
+class StartupProfileTest(SimpleTestCase):
+
+    def test_parse_importtime(self):
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   stripe.util\n'
+            'import time:       300 |        420 | stripe\n'
+        )
+        modules = parse_importtime(output)
+        self.assertEqual(modules[1], {'module': 'stripe', 'self_us': 300, 'cumulative_us': 420})
+        self.assertEqual(summarize_packages(modules), {'stripe': 420})
+
+    def test_optional_dependencies_are_not_loaded_at_startup(self):
+        stdout = io.StringIO()
+        with mock.patch.dict(os.environ, {'ENABLE_ROSETTA': '0'}):
+            call_command('startup_profile', json=True, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertIn('url_resolver', report['stages'])
+        self.assertIn('eshop', report['loaded'])
+        self.assertNotIn('stripe', report['loaded'])
+        self.assertNotIn('rosetta', report['loaded'])
+
+
 # @mark.django_db
 # def test_title_max_length():
 #     product = Product.objects.get()
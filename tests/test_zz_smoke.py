@@ -0,0 +1,42 @@
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth import get_user_model
+from eshop.models import Category, Product, Customer
+
+
+@pytest.fixture
+def catalog(db):
+    c = Category.objects.create(name='Notebooks', slug='notebooks')
+    for i in range(3):
+        Product.objects.create(category=c, title=f'p{i}', slug=f'p{i}', price=10 + i,
+                               image=SimpleUploadedFile(f'p{i}.jpg', b'', content_type='image/jpg'))
+    return c
+
+
+@pytest.mark.parametrize('url', ['/en/', '/lt/', '/en/category/notebooks/', '/en/products/p1/', '/en/cart/',
+                                 '/en/login/', '/en/registration/'])
+def test_anon_pages(client, catalog, url):
+    r = client.get(url)
+    assert r.status_code == 200, r
+
+
+def test_user_flow(client, catalog):
+    u = get_user_model().objects.create_user('bob', password='pw12345!x', first_name='B', last_name='C')
+    Customer.objects.create(user=u, phone='1', address='a')
+    client.login(username='bob', password='pw12345!x')
+    assert client.get('/en/add-to-cart/p1/').status_code == 302
+    assert client.get('/en/add-to-cart/p2/').status_code == 302
+    assert client.post('/en/change-qty/p1/', {'qty': 3}).status_code == 302
+    r = client.get('/en/cart/')
+    assert r.status_code == 200
+    assert r.context['cart'].final_price == 11 * 3 + 12
+    assert client.get('/en/remove-from-cart/p2/').status_code == 302
+    assert client.get('/en/profile/').status_code == 200
+    assert client.get('/en/').status_code == 200
+
+
+def test_badge(client, catalog):
+    client.get('/en/add-to-cart/p1/')
+    client.get('/en/add-to-cart/p2/')
+    r = client.get('/en/login/')
+    assert r.context['cart_total_products'] == 2